@@ -4,6 +4,9 @@ import binascii
 import math
 import os.path
 import sys
+import json
+import hashlib
+import sqlite3
 # @Author Jurijus Pacalovas
 
 # Get the name of the current script
@@ -15,6 +18,51 @@ if os.path.basename(sys.argv[0]) != 'Black_Hole_1.py':
 
 print("The script 'Black_Hole_1.py' is currently running.")
 
+# En searches kept on disk between runs, keyed by the bits searched
+TRIAL_CACHE_FILE = os.environ.get(
+    "BLACK_HOLE_1_TRIAL_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "black_hole_1", "trials.sqlite"),
+)
+TRIAL_CACHE_MAX_ENTRIES = 100000
+
+class TrialCache:
+    """
+    Encoded length and winning parameters per search key in SQLite.
+    Every read stamps the entry, and past max_entries the least
+    recently used go.
+    """
+
+    def __init__(self, path=TRIAL_CACHE_FILE, max_entries=TRIAL_CACHE_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("CREATE TABLE IF NOT EXISTS trials (key TEXT PRIMARY KEY, length INTEGER, params TEXT, used REAL)")
+        self.db.commit()
+
+    def get(self, key):
+        row = self.db.execute("SELECT length, params FROM trials WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE trials SET used = ? WHERE key = ?", (time(), key))
+        self.db.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key, length, params):
+        self.db.execute("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?)", (key, length, json.dumps(params), time()))
+        count, = self.db.execute("SELECT COUNT(*) FROM trials").fetchone()
+        if count > self.max_entries:
+            self.db.execute("DELETE FROM trials WHERE key IN (SELECT key FROM trials ORDER BY used LIMIT ?)", (count - self.max_entries,))
+        self.db.commit()
+
+    def report(self):
+        print(f"Trial cache: {self.hits} hits, {self.misses} misses (hit rate {self.hits / max(1, self.hits + self.misses):.1%})")
+
 class compression:
     def cryptograpy_compression4(self):
 
@@ -89,6 +137,8 @@ class compression:
 
                     En_number=28
 
+                trial_cache = TrialCache()
+
             # print(i)
             if os.path.exists(name):
                 print('Path is exists!')                
@@ -399,6 +449,13 @@ class compression:
 
 
 
+                                # The same bits searched with the same limits give the same En
+                                search_key = f"{hashlib.sha256(INFO.encode()).hexdigest()}:{long_11}:{En_number}"
+                                searched = trial_cache.get(search_key)
+                                if searched is not None:
+                                    En, C1 = searched[1]["En"], searched[1]["C1"]
+                                    Find = 2
+
                                 while Find != 1:
 
 
@@ -695,6 +752,9 @@ class compression:
 
 
 
+                                if searched is None:
+                                    trial_cache.put(search_key, len(TUPLE), {"En": En, "C1": C1})
+
                                 if Ci == 1:
 
 
@@ -2045,6 +2105,8 @@ class compression:
 
                                     print(f"Speed bits: {(long_11) / x3:.5f}")
 
+                                    trial_cache.report()
+
 
 
                                     print("checker seccesufully.")           
@@ -7,6 +7,26 @@ import binascii
 import math
 
 import os.path
+
+import sys
+
+import argparse
+
+import hashlib
+
+import json
+
+import subprocess
+
+import threading
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, wait
+
+try:
+        import numpy
+except ImportError:
+        numpy = None
  
 long_1=0
 
@@ -16,6 +36,689 @@ add_bits=""
 
 Make_togher=""
 
+# Ceiling of the seen-set that backs the unique-count bookkeeping (X1).
+# "reset" clears the set when full, "fifo" drops the oldest entries.
+SEEN_MAX_ELEMENTS=2**20*1024
+
+SEEN_MAX_BYTES=256*1024*1024
+
+SEEN_EVICTION="reset"
+
+class SeenSet:
+        """
+            Hashed seen-set with a memory ceiling.
+            Membership and insertion are O(1); the ceiling is checked on
+            both the number of entries and their approximate size in bytes.
+            """
+        def __init__(self, max_elements=SEEN_MAX_ELEMENTS, max_bytes=SEEN_MAX_BYTES, eviction=SEEN_EVICTION):
+                if eviction not in ("reset", "fifo"):
+                        raise ValueError("eviction must be 'reset' or 'fifo'")
+                self.max_elements = max_elements
+                self.max_bytes = max_bytes
+                self.eviction = eviction
+                self.size_bytes = 0
+                self._items = {}
+
+        def __contains__(self, item):
+                return item in self._items
+
+        def __len__(self):
+                return len(self._items)
+
+        def clear(self):
+                self._items.clear()
+                self.size_bytes = 0
+
+        def add(self, item):
+                """Adds item; returns False if it was already present."""
+                if item in self._items:
+                        return False
+                item_bytes = sys.getsizeof(item)
+                while self._items and (len(self._items) >= self.max_elements or self.size_bytes + item_bytes > self.max_bytes):
+                        if self.eviction == "reset":
+                                self.clear()
+                        else:
+                                oldest = next(iter(self._items))
+                                self.size_bytes -= self._items.pop(oldest)
+                self._items[item] = item_bytes
+                self.size_bytes += item_bytes
+                return True
+
+# Mersenne prime used for the residue check in AffinePruner.
+PRUNE_MODULUS=(2**61)-1
+
+class AffinePruner:
+        """
+            Rejects process_files steps that cannot produce the target.
+            process_files computes ((N*S + A)//3)*M with S=(2**Deep5)-1, so the
+            target must be a multiple of M and N*S + A must fall in
+            [3*(target//M), 3*(target//M)+2]. That is checked with bit-length
+            bounds and a residue modulo PRUNE_MODULUS, without any big-int multiply.
+            """
+        def __init__(self, target, Key=1):
+                self.target = target
+                self.Key = Key
+                self.checked = 0
+                self.pruned = 0
+                self._by_multiply = {}
+
+        def _quotient(self, Multiply):
+                # target//Multiply is linear in the size of the target, so it
+                # is done once per Multiply value (there are at most 256).
+                if Multiply not in self._by_multiply:
+                        if self.target % Multiply:
+                                self._by_multiply[Multiply] = None
+                        else:
+                                q3 = 3 * (self.target // Multiply)
+                                self._by_multiply[Multiply] = (q3, q3.bit_length(), q3 % PRUNE_MODULUS)
+                return self._by_multiply[Multiply]
+
+        def can_reach(self, Number_of_the_file, Deep5, Add_Numbers, Multiply):
+                """False only if process_files can not return the target."""
+                self.checked += 1
+                if Multiply <= 0 or Add_Numbers < 0 or Number_of_the_file < 0 or Deep5 < 0:
+                        return True
+                entry = self._quotient(Multiply)
+                if entry is None:
+                        self.pruned += 1
+                        return False
+                q3, q3_bits, q3_mod = entry
+                if Number_of_the_file >= 2**26*1024*1024:
+                        Number_of_the_file = 2**26*1024*1024
+                if Deep5 <= max(64, self.Key.bit_length() + 1):
+                        # Small powers are cheap, so check the step exactly
+                        value = Number_of_the_file * max((2**Deep5) - 1, self.Key) + Add_Numbers
+                        reach = q3 <= value <= q3 + 2
+                elif Number_of_the_file == 0:
+                        reach = q3 <= Add_Numbers <= q3 + 2
+                else:
+                        # N*S has bit length bits or bits-1, and N*S must lie in
+                        # [q3-A, q3-A+2]; while A is small that range keeps the
+                        # bit length of q3 give or take one.
+                        bits = Number_of_the_file.bit_length() + Deep5
+                        small_add = Add_Numbers.bit_length() < q3_bits - 1
+                        if (small_add and bits < q3_bits - 1) or bits - 1 > q3_bits + 1:
+                                reach = False
+                        else:
+                                residue = (Number_of_the_file % PRUNE_MODULUS) * (pow(2, Deep5, PRUNE_MODULUS) - 1) + Add_Numbers - q3_mod
+                                reach = residue % PRUNE_MODULUS <= 2
+                if not reach:
+                        self.pruned += 1
+                return reach
+
+parser = argparse.ArgumentParser(description="Black Hole search")
+parser.add_argument("--resume", action="store_true", help="continue the search from the last checkpoint")
+parser.add_argument("--checkpoint-every", type=float, default=60.0, help="seconds between checkpoints (default 60)")
+parser.add_argument("--bigint", choices=("auto", "gmpy2", "int"), default="auto", help="big-integer backend for process_files")
+parser.add_argument("--deadline", type=float, default=None, help="seconds the compress search may run before the input is stored as is")
+parser.add_argument("--max-candidates", type=int, default=None, help="candidates the compress search may try before the input is stored as is")
+parser.add_argument("--progress", type=float, default=30.0, help="seconds between progress lines on stderr, 0 turns them off (default 30)")
+parser.add_argument("--status-file", default=None, help="file that always holds the latest progress line")
+parser.add_argument("--progress-json", default=None, help="file to append progress as JSON lines")
+parser.add_argument("--batch", type=int, default=4096, help="candidates evaluated at once with NumPy while they fit in 64 bits, 0 turns it off")
+parser.add_argument("--coordinator", default=None, metavar="HOST:PORT", help="hand the compress search out to workers connecting to this address")
+parser.add_argument("--workers", type=int, default=0, help="local worker processes the coordinator starts")
+parser.add_argument("--worker", default=None, metavar="HOST:PORT", help="run as a search worker for the coordinator at this address")
+parser.add_argument("--range-size", type=int, default=1 << 20, help="k2 candidates per work unit (default 2**20)")
+parser.add_argument("--authkey", default=None, help="shared secret between coordinator and workers (visible to ps; prefer --authkey-file or $BLACK_HOLE_AUTHKEY)")
+parser.add_argument("--authkey-file", default=None, metavar="PATH", help="file holding the shared secret, - reads it from stdin")
+parser.add_argument("--replay", choices=("fast", "loop"), default="fast", help="extract by replaying only the matched chain, or by rerunning the search loop")
+options, unknown_options = parser.parse_known_args()
+
+def select_bigint_backend(name="auto"):
+        """
+            Returns (backend name, integer type) for the process_files arithmetic.
+            "auto" uses GMP through gmpy2 when it is installed and falls back to
+            the built-in int; "gmpy2" insists on gmpy2 and "int" never uses it.
+            """
+        if name in ("auto", "gmpy2"):
+                try:
+                        import gmpy2
+                        return "gmpy2", gmpy2.mpz
+                except ImportError:
+                        if name == "gmpy2":
+                                raise
+        return "int", int
+
+BIGINT_BACKEND, big_int = select_bigint_backend(options.bigint)
+
+# Written instead of a search result when the budget runs out; a real
+# result has at most 8 leading zero bits, so it never starts like this.
+VERBATIM_MARKER=b"\x00\x00"
+
+def search_budget_exhausted(candidates, started):
+        """True once --max-candidates or --deadline has been used up."""
+        if options.max_candidates is not None and candidates >= options.max_candidates:
+                return True
+        return options.deadline is not None and time() - started >= options.deadline
+
+class SearchProgress:
+        """
+            Periodic progress of the k2 search: a line on stderr, the same line
+            in a status file that is replaced each time, and/or a stream of
+            JSON lines for machines.
+            """
+        def __init__(self, every, status_file=None, json_file=None, mode="compress", k2=-1):
+                self.every = every
+                self.status_file = status_file
+                self.json_file = json_file
+                self.mode = mode
+                self.last_time = time()
+                self.last_k2 = k2
+
+        def due(self):
+                return self.every > 0 and time() - self.last_time >= self.every
+
+        def report(self, k2, X1, Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT):
+                now = time()
+                if k2 < self.last_k2:
+                        rate = 0.0
+                else:
+                        rate = (k2 - self.last_k2) / max(now - self.last_time, 1e-9)
+                self.last_time = now
+                self.last_k2 = k2
+                # k2 runs up to 2**((8*X1)+40)-1 before the width wraps around;
+                # the estimate is kept as a logarithm because it is usually huge.
+                remaining = 2**((8*X1)+40) - 1 - k2
+                if rate > 0 and remaining > 0:
+                        eta_log10 = math.log10(remaining) - math.log10(rate)
+                else:
+                        eta_log10 = None
+                if eta_log10 is None:
+                        eta = "unknown"
+                elif eta_log10 < 9:
+                        eta = "%.0f s" % (10**eta_log10)
+                else:
+                        eta = "10^%.1f years" % (eta_log10 - math.log10(365.25*24*3600))
+                line = "%s: %.0f candidates/s, k2 = %d, X1 = %d, Times_12 = %d, Multiply = %d, Add_Numbers = %d, SQUARE_OF_ROOT = %d, X1 width exhausted in %s" % (
+                        self.mode, rate, k2, X1, Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, eta)
+                print(line, file=sys.stderr)
+                if self.status_file:
+                        temp_path = self.status_file + ".tmp"
+                        with open(temp_path, "w") as f:
+                                f.write(line + "\n")
+                        os.replace(temp_path, self.status_file)
+                if self.json_file:
+                        record = {"time": now, "mode": self.mode, "candidates_per_sec": rate, "k2": k2, "X1": X1,
+                                  "Times_12": Times_12, "Multiply": Multiply, "Add_Numbers": Add_Numbers,
+                                  "SQUARE_OF_ROOT": SQUARE_OF_ROOT, "eta_log10_seconds": eta_log10}
+                        with open(self.json_file, "a") as f:
+                                f.write(json.dumps(record) + "\n")
+
+def batch_first_match(first_k2, count, target, Key=1):
+        """
+            Vectorized compress search for k2 below 2**32, where every
+            Times_12 chain is a single process_files step, and a target below
+            2**64. Returns the index of the first k2 in [first_k2,
+            first_k2+count) whose step gives target, or -1.
+            Steps that overflow 64 bits are redone with Python ints.
+            """
+        k2 = numpy.arange(first_k2, first_k2 + count, dtype=numpy.uint64)
+        N = k2 & 0xFF
+        D = (k2 >> 8) & 0xFF
+        A = (k2 >> 16) & 0xFF
+        M = (k2 >> 24) & 0xFF
+        M[M == 0] = 1
+        limit = numpy.uint64(2**64 - 1)
+        small = D < 64
+        S = numpy.maximum((numpy.uint64(1) << numpy.minimum(D, 63)) - 1, numpy.uint64(Key))
+        # N*S + A fits when N is 0 or S <= (limit - A) // N; the quotient
+        # then has to fit once more after the multiply by M
+        fits = (N == 0) | (small & (S <= (limit - A) // numpy.maximum(N, 1)))
+        S[~fits] = 0
+        q = (N * S + A) // 3
+        fits &= q <= limit // M
+        hits = numpy.flatnonzero(fits & (q * M == target))
+        first = int(hits[0]) if hits.size else count
+        # With N >= 1 and D >= 67 the step is at least 2**66 / 3 > 2**64 > target
+        unsure = numpy.flatnonzero(~fits[:first] & (D[:first] < 67))
+        for index in unsure.tolist():
+                Number_of_the_file = int(N[index])
+                Square_of_ROOT = max((2**int(D[index])) - 1, Key)
+                if (((Number_of_the_file * Square_of_ROOT) + int(A[index])) // 3) * int(M[index]) == target:
+                        return index
+        return first if first < count else -1
+
+class PowerOfTwo:
+        """
+            Lazy 2**exponent - offset, with offset 0 or 1.
+            Multiplying by it is a shift and a subtraction and comparisons go
+            by bit length, so the full integer is only built by int() when
+            the value really has to be written out.
+            """
+        __slots__ = ("exponent", "offset")
+
+        def __init__(self, exponent, offset=0):
+                if exponent < 0 or offset not in (0, 1):
+                        raise ValueError("PowerOfTwo needs exponent >= 0 and offset 0 or 1")
+                self.exponent = exponent
+                self.offset = offset
+
+        def __int__(self):
+                return (1 << self.exponent) - self.offset
+
+        __index__ = __int__
+
+        def __repr__(self):
+                return "PowerOfTwo(%d, %d)" % (self.exponent, self.offset)
+
+        def bit_length(self):
+                return self.exponent + 1 - self.offset
+
+        def __mul__(self, other):
+                if isinstance(other, PowerOfTwo):
+                        # (2**a - o)*(2**b - p) = 2**(a+b) - o*2**b - p*2**a + o*p
+                        product = big_int(1) << (self.exponent + other.exponent)
+                        if self.offset:
+                                product -= big_int(1) << other.exponent
+                        if other.offset:
+                                product -= big_int(1) << self.exponent
+                        return product + self.offset * other.offset
+                other = big_int(other)
+                shifted = other << self.exponent
+                return shifted - other if self.offset else shifted
+
+        __rmul__ = __mul__
+
+        def _compare(self, other):
+                if isinstance(other, PowerOfTwo):
+                        other_bits = other.bit_length()
+                else:
+                        if other < 0:
+                                return 1
+                        other_bits = other.bit_length()
+                bits = self.bit_length()
+                if bits != other_bits:
+                        return -1 if bits < other_bits else 1
+                # Same size: building the value costs no more than other already does
+                value = int(self)
+                other = int(other)
+                return (value > other) - (value < other)
+
+        def __eq__(self, other):
+                return self._compare(other) == 0
+
+        def __ne__(self, other):
+                return self._compare(other) != 0
+
+        def __lt__(self, other):
+                return self._compare(other) < 0
+
+        def __le__(self, other):
+                return self._compare(other) <= 0
+
+        def __gt__(self, other):
+                return self._compare(other) > 0
+
+        def __ge__(self, other):
+                return self._compare(other) >= 0
+
+        def __hash__(self):
+                return hash(int(self))
+
+def power_of_two(exponent, offset=0):
+        """2**exponent - offset, lazy for the exponents the searches use."""
+        if exponent < 0:
+                return 2**exponent - offset
+        return PowerOfTwo(exponent, offset)
+
+def multiply_big(a, b):
+        """a*b on the big-integer backend; a lazy power of two turns it into shifts."""
+        if isinstance(a, PowerOfTwo):
+                return a * b
+        if isinstance(b, PowerOfTwo):
+                return b * a
+        return big_int(a) * b
+
+def checkpoint_id(script, mode, INFO):
+        """Identifies a search: the script, compress/extract and the input bits."""
+        return script + ":" + str(mode) + ":" + hashlib.sha256(INFO.encode()).hexdigest()
+
+def save_checkpoint(path, search_id, state):
+        """
+            Writes the search state atomically: the state goes to a temporary
+            file which is then renamed over the previous checkpoint.
+            Integers are stored as hex because they can be far too long
+            for a decimal conversion.
+            """
+        ints = {}
+        strs = {}
+        for key, value in state.items():
+                if isinstance(value, str):
+                        strs[key] = value
+                else:
+                        ints[key] = hex(value)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+                json.dump({"id": search_id, "ints": ints, "strs": strs}, f)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+def load_checkpoint(path, search_id):
+        """Returns the saved state, or None if there is no checkpoint for this search."""
+        if not os.path.exists(path):
+                return None
+        with open(path) as f:
+                saved = json.load(f)
+        if saved.get("id") != search_id:
+                print("Checkpoint", path, "belongs to another search, starting over.")
+                return None
+        state = {key: int(value, 16) for key, value in saved["ints"].items()}
+        state.update(saved["strs"])
+        return state
+
+def remove_checkpoint(path):
+        if os.path.exists(path):
+                os.remove(path)
+
+def candidate_fields(k2):
+        """(Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, Multiply_Times) of a compress candidate, zeros read as in the loop."""
+        return (((k2 >> 32) & 0xFF) or 1, ((k2 >> 24) & 0xFF) or 1, (k2 >> 16) & 0xFF, (k2 >> 8) & 0xFF, k2 & 0xFF)
+
+def chain_state_at(k2):
+        """
+            (File_information6_Times2, File_information6_Times2_1) at the top of
+            the compress iteration for k2, in a search started at k2=0: the
+            number of steps already in the current Times_12 chain and the
+            length of the last finished chain.
+            Times_12 only changes every 2**32 candidates, so this is worked
+            out a block at a time.
+            """
+        steps = 0
+        last = 0
+        for block in range((k2 >> 32) + 1):
+                length = min(2**32, k2 - (block << 32))
+                Times_12 = (block & 0xFF) or 1
+                if steps < Times_12:
+                        if steps + length >= Times_12:
+                                last = Times_12
+                        steps = (steps + length) % Times_12
+                else:
+                        # The counter is already past Times_12 and never resets here
+                        steps += length
+        return steps, last
+
+def process_step(Number_of_the_file, Deep5, Add_Numbers, Multiply, Key=1):
+        """The number process_files returns, without its counts bookkeeping."""
+        Square_of_ROOT = power_of_two(min(Deep5, 26*1024*1024), 1)
+        if Square_of_ROOT <= Key:
+                Square_of_ROOT = Key
+        if Number_of_the_file >= 2**26*1024*1024:
+                Number_of_the_file = 2**26*1024*1024
+        return int((((multiply_big(Number_of_the_file, Square_of_ROOT)) + Add_Numbers) // 3) * Multiply)
+
+def replay_chain(start, stop, Key=1):
+        """Runs the chain that starts at k2=start up to, not including, stop; returns (Number_of_the_file, Deep5)."""
+        Times_12, Multiply, Add_Numbers, Deep5, Number_of_the_file = candidate_fields(start)
+        for k2 in range(start, stop):
+                Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, Multiply_Times = candidate_fields(k2)
+                Number_of_the_file = process_step(Number_of_the_file, Deep5, Add_Numbers, Multiply, Key)
+        return Number_of_the_file, Deep5
+
+def search_range(first, count, target, Key=1, pruner=None, cancelled=None):
+        """
+            The compress search over k2 in [first, first+count), for a search
+            started at k2=0. Returns the first k2 whose step gives target while
+            the last finished chain has the current Times_12 (the loop's match
+            condition), or None. cancelled() is polled between batches.
+            """
+        if pruner is None:
+                pruner = AffinePruner(target, Key)
+        steps, last = chain_state_at(first)
+        Number_of_the_file = 0
+        Deep5 = 0
+        if steps:
+                Number_of_the_file, Deep5 = replay_chain(first - steps, first, Key)
+        k2 = first
+        end = first + count
+        polled = first
+        while k2 < end:
+                if cancelled is not None and k2 - polled >= 4096:
+                        polled = k2
+                        if cancelled():
+                                return None
+                Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, Multiply_Times = candidate_fields(k2)
+                if numpy is not None and options.batch > 1 and steps == 0 and Times_12 == 1 and target < 2**64:
+                        # Single-step chains up to the end of this 2**32 block
+                        size = min(end, ((k2 >> 32) + 1) << 32, k2 + options.batch) - k2
+                        index = batch_first_match(k2, size, target, Key)
+                        if index >= 0:
+                                return k2 + index
+                        last = 1
+                        k2 += size
+                        continue
+                if steps == 0:
+                        Number_of_the_file = Multiply_Times
+                        Deep5 = SQUARE_OF_ROOT
+                if steps + 1 == Times_12 and not pruner.can_reach(Number_of_the_file, min(Deep5, 26*1024*1024), Add_Numbers, Multiply):
+                        Number_of_the_file = -1
+                else:
+                        Number_of_the_file = process_step(Number_of_the_file, Deep5, Add_Numbers, Multiply, Key)
+                steps += 1
+                if steps == Times_12:
+                        last = steps
+                        steps = 0
+                if Number_of_the_file == target and last == Times_12:
+                        return k2
+                k2 += 1
+        return None
+
+def read_header(data):
+        """
+            (XR, long) from the header of a compressed file, read straight off
+            the integer: leading zero bits, a 1, then X1 and the input length
+            in bits, each as an 8-bit width of a width of the value.
+            """
+        n = int.from_bytes(data, "big")
+        position = n.bit_length() - 1
+
+        def field(width):
+                nonlocal position
+                position -= width
+                if position < 0:
+                        raise ValueError("truncated header")
+                return (n >> position) & ((1 << width) - 1)
+
+        XR = field(field(field(8)))
+        long = field(field(8))
+        return XR, long
+
+def replay_extract(data, Key=1):
+        """
+            Decodes a compressed file without rerunning the search. X1 is k2+2
+            at the step that matched, so only the Times_12 chain that ends at
+            k2=XR-2 is replayed. Returns (output bytes, k2, steps replayed), or
+            None when the header does not describe a match.
+            """
+        XR, long = read_header(data)
+        k2 = XR - 2
+        if k2 < 0:
+                return None
+        steps, last = chain_state_at(k2)
+        Times_12 = candidate_fields(k2)[0]
+        if steps + 1 == Times_12:
+                last = Times_12
+        if last != Times_12:
+                return None
+        Number_of_the_file, Deep5 = replay_chain(k2 - steps, k2 + 1, Key)
+        return Number_of_the_file.to_bytes(max(long // 8, (Number_of_the_file.bit_length() + 7) // 8), "big"), k2, steps + 1
+
+def parse_address(text):
+        host, port = text.rsplit(":", 1)
+        return host, int(port)
+
+# Messages between coordinator and workers are pickles, so only a secret
+# the user supplies (or a random one for local workers) may guard them
+AUTHKEY_ENV = "BLACK_HOLE_AUTHKEY"
+
+def load_authkey(options):
+        """
+            The coordinator/worker secret from --authkey-file (- for stdin),
+            else $BLACK_HOLE_AUTHKEY, else --authkey; None if none is given.
+            """
+        if options.authkey_file == "-":
+                key = sys.stdin.buffer.read().strip()
+        elif options.authkey_file:
+                with open(options.authkey_file, "rb") as f:
+                        key = f.read().strip()
+        else:
+                key = (os.environ.get(AUTHKEY_ENV) or options.authkey or "").encode()
+        return key or None
+
+def run_coordinator(address, authkey, target, Key=1, range_size=1 << 20, workers=0, deadline=None):
+        """
+            Hands out k2 ranges to workers over a socket and returns the first
+            k2 that reproduces target. A match is only final once every range
+            below it has been searched, so the result is the candidate the
+            sequential search would find; ranges above a match are cancelled.
+            workers starts that many local worker processes. Returns None if
+            the deadline (a time() value) passes first.
+            """
+        listener = Listener(address, authkey=authkey)
+        connections = []
+
+        def accept():
+                while True:
+                        try:
+                                connections.append(listener.accept())
+                        except AuthenticationError:
+                                continue  # A wrong secret only turns that client away
+                        except (OSError, EOFError):
+                                return
+
+        threading.Thread(target=accept, daemon=True).start()
+        host, port = listener.address
+        print("Coordinator listening on %s:%d" % (host, port))
+        # Local workers get the secret on stdin, never on their command line,
+        # and search with the same --batch and --bigint as the coordinator
+        processes = []
+        for _ in range(workers):
+                process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "%s:%d" % (host, port), "--authkey-file", "-",
+                                            "--batch", str(options.batch), "--bigint", options.bigint],
+                                           stdin=subprocess.PIPE)
+                process.stdin.write(authkey)
+                process.stdin.close()
+                processes.append(process)
+        next_k2 = 0
+        requeued = []
+        pending = {}
+        idle = []
+        best = None
+
+        def drop(conn):
+                # A lost worker's ranges go back into the queue
+                if conn in connections:
+                        connections.remove(conn)
+                if conn in idle:
+                        idle.remove(conn)
+                for first, owner in list(pending.items()):
+                        if owner is conn:
+                                del pending[first]
+                                requeued.append(first)
+
+        def send(conn, message):
+                try:
+                        conn.send(message)
+                except (EOFError, OSError):
+                        drop(conn)
+                        return False
+                return True
+
+        try:
+                while best is None or any(first < best for first in pending) or any(first < best for first in requeued):
+                        if deadline is not None and time() >= deadline:
+                                print("Coordinator ran out of time at k2 =", next_k2)
+                                return None
+                        for conn in wait(list(connections), timeout=0.5):
+                                try:
+                                        message = conn.recv()
+                                except (EOFError, OSError):
+                                        drop(conn)
+                                        continue
+                                if message[0] == "ready":
+                                        if not send(conn, ("setup", target, Key)):
+                                                continue
+                                elif message[0] == "done":
+                                        first, match = message[1], message[2]
+                                        pending.pop(first, None)
+                                        if match is not None and (best is None or match < best):
+                                                best = match
+                                                print("Match at k2 =", best)
+                                                for other, owner in list(pending.items()):
+                                                        if other > best and pending.get(other) is owner:
+                                                                del pending[other]
+                                                                if not send(owner, ("cancel",)):
+                                                                        continue
+                                                                if owner not in idle and owner not in pending.values():
+                                                                        idle.append(owner)
+                                if conn not in idle and conn not in pending.values():
+                                        idle.append(conn)
+                        requeued.sort()
+                        while idle:
+                                if requeued and (best is None or requeued[0] < best):
+                                        first = requeued.pop(0)
+                                elif best is None:
+                                        first = next_k2
+                                        next_k2 += range_size
+                                else:
+                                        break
+                                conn = idle.pop()
+                                pending[first] = conn
+                                send(conn, ("range", first, range_size))
+        finally:
+                for conn in connections:
+                        try:
+                                conn.send(("stop",))
+                        except (EOFError, OSError):
+                                pass
+                listener.close()
+                for process in processes:
+                        process.wait()
+        return best
+
+def run_worker(address, authkey):
+        """Searches the k2 ranges a coordinator hands out until it says stop."""
+        conn = Client(address, authkey=authkey)
+        conn.send(("ready",))
+        target = None
+        Key = 1
+        pruner = None
+        while True:
+                try:
+                        message = conn.recv()
+                except (EOFError, OSError):
+                        break
+                if message[0] == "setup":
+                        target, Key = message[1], message[2]
+                        pruner = AffinePruner(target, Key)
+                        continue
+                if message[0] == "stop":
+                        break
+                if message[0] == "cancel":
+                        continue
+                first, count = message[1], message[2]
+                match = search_range(first, count, target, Key, pruner, conn.poll)
+                # Anything sent while a range is searched cancels it
+                if not conn.poll():
+                        conn.send(("done", first, match))
+        conn.close()
+
+if options.worker:
+        Authkey = load_authkey(options)
+        if Authkey is None:
+                sys.exit("A worker needs the coordinator's secret: --authkey-file, $%s or --authkey." % AUTHKEY_ENV)
+        run_worker(parse_address(options.worker), Authkey)
+        raise SystemExit
+
+if options.coordinator:
+        Authkey = load_authkey(options)
+        if Authkey is None:
+                if not options.workers:
+                        sys.exit("A coordinator needs a secret for its workers: --authkey-file, $%s or --authkey." % AUTHKEY_ENV)
+                # Nobody else knows it, so only the local workers can join
+                Authkey = os.urandom(32).hex().encode()
+
 
 
 
@@ -71,7 +774,8 @@ class compression:
                                 
                         
 
-                        Number_of_the_file =((((Number_of_the_file * Square_of_ROOT) + Add_Numbers) // 3) * Multiply)
+                        # The multiply and floor divide run on the selected big-integer backend
+                        Number_of_the_file =int((((multiply_big(Number_of_the_file, Square_of_ROOT)) + Add_Numbers) // 3) * Multiply)
                         #print(Number_of_the_file)
 
                         F=0
@@ -216,6 +920,38 @@ class compression:
 
                         	 raise SystemExit
 
+                        if i==2 and data[:2]==VERBATIM_MARKER:
+
+                                # The compress search ran out of budget and stored the input as is
+
+                                with open(name[:len(name)-4], "wb") as f2:
+
+                                        f2.write(data[2:])
+
+                                return str(time()-x)
+
+                        if i==2 and options.replay=="fast":
+
+                                Replay_time=time()
+
+                                Replayed=replay_extract(data, Key)
+
+                                if Replayed is not None:
+
+                                        Output, Replay_k2, Replay_steps = Replayed
+
+                                        Replay_time=time()-Replay_time
+
+                                        print("Replayed", Replay_steps, "steps of the chain ending at k2 =", Replay_k2, "in %.3f s (%.0f steps/s)" % (Replay_time, Replay_steps/max(Replay_time, 1e-9)))
+
+                                        with open(name[:len(name)-4], "wb") as f2:
+
+                                                f2.write(Output)
+
+                                        return str(time()-x)
+
+                                print("Header does not match a chain, rerunning the search loop")
+
                         END_working=0
 
                         File_information6_Times2=0
@@ -377,8 +1113,139 @@ class compression:
                                     num=0
                                     result=0
 
+                                    X4=SeenSet()
+
+                                    Pruner=AffinePruner(int(INFO,2), Key)
+
+                                    Batch_target=Pruner.target if Pruner.target<2**64 else None
+
+                                    Checkpoint_name=name+".ckpt"
+
+                                    Checkpoint_id=checkpoint_id("Black_Hole_28", i, INFO)
+
+                                    Checkpoint_time=time()
+
+                                    State=None
+
+                                    if options.resume:
+
+                                            State=load_checkpoint(Checkpoint_name, Checkpoint_id)
+
+                                    if State is not None:
+
+                                            k1=State["k1"]
+                                            k2=State["k2"]
+                                            X1=State["X1"]
+                                            counts=State["counts"]
+                                            y=State["y"]
+                                            Times_12=State["Times_12"]
+                                            University=State["University"]
+                                            Deep5=State["Deep5"]
+                                            Number_of_the_file=State["Number_of_the_file"]
+                                            File_information6_Times2=State["File_information6_Times2"]
+                                            File_information6_Times2_1=State["File_information6_Times2_1"]
+                                            File_information5_2=State["File_information5_2"]
+
+                                            print("Resumed from checkpoint at k2 =", k2)
+
+                                    if options.coordinator and State is None:
+
+                                            Deadline=None if options.deadline is None else x+options.deadline
+
+                                            Match=run_coordinator(parse_address(options.coordinator), Authkey, Pruner.target, Key, options.range_size, options.workers, Deadline)
+
+                                            if Match is not None:
+
+                                                    # Continue the loop just before the match, as if the
+                                                    # candidates below it had been searched here.
+                                                    Chain_steps, Chain_last = chain_state_at(Match)
+
+                                                    k1=Match-2
+
+                                                    k2=Match-1
+
+                                                    X1=Match+1
+
+                                                    File_information6_Times2=Chain_steps
+
+                                                    File_information6_Times2_1=Chain_last
+
+                                                    if Chain_steps:
+
+                                                            Number_of_the_file, Deep5 = replay_chain(Match-Chain_steps, Match, Key)
+
+                                                            File_information5_2=bin(Number_of_the_file)[2:]
+
+                                    Candidates=0
+
+                                    Progress=SearchProgress(options.progress, options.status_file, options.progress_json, "compress" if i==1 else "extract", k2)
+
                                     while Extract1!=1:
 
+                                            if k2>=0 and time()-Checkpoint_time>=options.checkpoint_every:
+
+                                                    save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "Deep5": Deep5, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    Checkpoint_time=time()
+
+                                            if search_budget_exhausted(Candidates, x):
+
+                                                    # Out of budget: no candidate so far decodes to the input, so store it
+                                                    # verbatim and keep a checkpoint for a later --resume.
+                                                    if k2>=0:
+
+                                                            save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "Deep5": Deep5, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    print("Search budget used up after", Candidates, "candidates: k2 =", k2, "X1 =", X1)
+
+                                                    print("Covered %.3g%% of the 2**40 (Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, Multiply_Times) tuples" % (100.0*(k2+1)/2**40))
+
+                                                    name=name+".bin"
+
+                                                    with open(name, "wb") as f2:
+
+                                                        # Written through paq like the normal output, extraction unpacks it first
+                                                        import paq
+                                                        f2.write(paq.compress(VERBATIM_MARKER+data))
+
+                                                    print("Stored", name, "verbatim")
+
+                                                    return str(time()-x)
+
+                                            if numpy is not None and options.batch>1 and Batch_target is not None and File_information6_Times2==0 and k2+1+options.batch<=2**32:
+
+                                                    Batch_size=options.batch
+
+                                                    if options.max_candidates is not None:
+
+                                                            Batch_size=min(Batch_size, options.max_candidates-Candidates)
+
+                                                    Batch_index=batch_first_match(k2+1, Batch_size, Batch_target, Key)
+
+                                                    # Jump over the candidates that can not match. X1 counts every
+                                                    # candidate, so it moves with k2; a matching candidate is then
+                                                    # evaluated by the loop body as before.
+                                                    Skip=Batch_size if Batch_index<0 else Batch_index
+
+                                                    k1+=Skip
+
+                                                    k2+=Skip
+
+                                                    X1+=Skip
+
+                                                    Candidates+=Skip
+
+                                                    if Progress.due():
+
+                                                            # The fields the loop body would cut out of k2
+                                                            Progress.report(k2, X1, (k2>>32)&255, (k2>>24)&255, (k2>>16)&255, (k2>>8)&255)
+
+                                                    if Batch_index<0:
+
+                                                            continue
+
+                                            Candidates+=1
+
                                             k1+=1
 
                                             k2+=1
@@ -439,14 +1306,18 @@ class compression:
 
                                             SQUARE_OF_ROOT=int(University_file[(X2*8)+24:(X2*8)+32],2)
                                             Multiply_Times=int(University_file[(X2*8)+32:(X2*8)+40],2)
+
+                                            if Progress.due():
+
+                                                    Progress.report(k2, X1, Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT)
                                             #print(X1)
                                     
                                  
                                     
                                             # Initialize variables
-                                            X4 = []  # Initialize an empty list X4
-                                          # Initialize counter X1
-                                            max_elements = 2**20 * 1024
+                                            # X1 counts candidates: extraction replays the search up to X1==XR,
+                                            # so the seen-set only ever holds the current candidate.
+                                            X4.clear()
                                             user_input = "random"
                                             if user_input.lower() == "random":
                                                         # Generate a random number
@@ -470,13 +1341,8 @@ class compression:
                                             else:
                                                         X1 += 1  # Increment X1
                                             
-                                                    # Add N4 to the list if the maximum size is not exceeded
-                                            if len(X4) < max_elements:
-                                                        X4.append(N4)
-                                            else:
-                                                        #print("Maximum list size reached! Resetting...")
-                                                        X4 = []  # Reset the list
-                                                         # Reset the counter
+                                                    # Add N4 to the seen-set; it evicts on its own memory ceiling
+                                            X4.add(N4)
                                             
                                                     # Print the updated values of X1 and the size of X4
 
@@ -613,21 +1479,29 @@ class compression:
 
                                                             Number_of_the_file=0
 
-                                                        if Deep5<=26*1024*1024:
+                                                        # Only the last step of a chain is compared with INFO, so a
+                                                        # step that can not reach it skips the big-int work entirely.
+                                                        if File_information6_Times2+1==Times_12 and not Pruner.can_reach(Number_of_the_file, min(Deep5, 26*1024*1024), Add_Numbers, Multiply):
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                            Number_of_the_file=-1
 
                                                         else:
 
-                                                                Deep5=26*1024*1024
+                                                            if Deep5<=26*1024*1024:
+
+                                                                    Hole_Number_information=power_of_two(Deep5, 1)
+
+                                                            else:
+
+                                                                    Deep5=26*1024*1024
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                    Hole_Number_information=power_of_two(Deep5, 1)
 
                                                                 
 
-                                                        Square_of_ROOT=Hole_Number_information
+                                                            Square_of_ROOT=Hole_Number_information
 
-                                                        Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts = process_files(Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts)
+                                                            Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts = process_files(Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts)
 
 
 
@@ -744,7 +1618,7 @@ class compression:
                                             File_information5_2=Clear
 
                                             name=name+".bin"
-                                            if i == 2:
+                                            if i == 1:
                                             	import paq
                                             	width_bits3 = paq.compress(width_bits3)
 
@@ -764,6 +1638,8 @@ class compression:
 
                                             xs=str(xs)
 
+                                            remove_checkpoint(Checkpoint_name)
+
                                             return xs;
 
 
@@ -878,8 +1754,47 @@ class compression:
                                     result=0
                                   
 
+                                    X4=SeenSet()
+
+                                    Checkpoint_name=name+".ckpt"
+
+                                    Checkpoint_id=checkpoint_id("Black_Hole_28", i, INFO)
+
+                                    Checkpoint_time=time()
+
+                                    State=None
+
+                                    if options.resume:
+
+                                            State=load_checkpoint(Checkpoint_name, Checkpoint_id)
+
+                                    if State is not None:
+
+                                            k1=State["k1"]
+                                            k2=State["k2"]
+                                            X1=State["X1"]
+                                            counts=State["counts"]
+                                            y=State["y"]
+                                            Times_12=State["Times_12"]
+                                            University=State["University"]
+                                            Deep5=State["Deep5"]
+                                            Number_of_the_file=State["Number_of_the_file"]
+                                            File_information6_Times2=State["File_information6_Times2"]
+                                            File_information6_Times2_1=State["File_information6_Times2_1"]
+                                            File_information5_2=State["File_information5_2"]
+
+                                            print("Resumed from checkpoint at k2 =", k2)
+
+                                    Progress=SearchProgress(options.progress, options.status_file, options.progress_json, "compress" if i==1 else "extract", k2)
+
                                     while Extract1!=1:
 
+                                            if k2>=0 and time()-Checkpoint_time>=options.checkpoint_every:
+
+                                                    save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "Deep5": Deep5, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    Checkpoint_time=time()
+
                                             k1+=1
 
                                             k2+=1
@@ -938,13 +1853,17 @@ class compression:
                                             SQUARE_OF_ROOT=int(University_file[(X2*8)+24:(X2*8)+32],2)
 
                                             Multiply_Times=int(University_file[(X2*8)+32:(X2*8)+40],2)
+
+                                            if Progress.due():
+
+                                                    Progress.report(k2, X1, Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT)
                                          
 
                                    
                                             # Initialize variables
-                                            X4 = []  # Initialize an empty list X4
-                                          # Initialize counter X1
-                                            max_elements = 2**20 * 1024
+                                            # X1 counts candidates: extraction replays the search up to X1==XR,
+                                            # so the seen-set only ever holds the current candidate.
+                                            X4.clear()
                                             user_input = "random"
                                             if user_input.lower() == "random":
                                                         # Generate a random number
@@ -968,13 +1887,8 @@ class compression:
                                             else:
                                                         X1 += 1  # Increment X1
                                             
-                                                    # Add N4 to the list if the maximum size is not exceeded
-                                            if len(X4) < max_elements:
-                                                        X4.append(N4)
-                                            else:
-                                                        #print("Maximum list size reached! Resetting...")
-                                                        X4 = []  # Reset the list
-                                                         # Reset the counter
+                                                    # Add N4 to the seen-set; it evicts on its own memory ceiling
+                                            X4.add(N4)
                                             
                                                     # Print the updated values of X1 and the size of X4
 
@@ -1110,19 +2024,19 @@ class compression:
 
                                                             Number_of_the_file=0
 
-                                                        Hole_Number_information=(2**Deep5)-1
+                                                        Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         Square_of_ROOT=Hole_Number_information
 
                                                         if Deep5<=26*1024*1024:
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         else:
 
                                                                 Deep5=26*1024*1024
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts = process_files(Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts)
 
@@ -1210,6 +2124,8 @@ class compression:
 
                                             xs=str(xs)
 
+                                            remove_checkpoint(Checkpoint_name)
+
                                             return xs;
 
 d=compression()
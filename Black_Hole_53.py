@@ -1,54 +1,297 @@
 import os
+import io
+import mmap
+import struct
+import collections
+import concurrent.futures
 import paq
 from mpmath import mp
+from mpmath.libmp import from_man_exp, round_nearest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 print("Created by Jurijus Pacalovas.")
 print("Black_Hole_53")
 
-# Symbol and space mapping (5-bit representation)
-symbol_map = {
-    " ": 0b00001,
-    ".": 0b00010,
-    ",": 0b00011,
-    "?": 0b00100,
-    "!": 0b00101,
-    "-": 0b00110,
-    "'": 0b00111,
-    '"': 0b01000,
-    ":": 0b01001,
-    ";": 0b01010,
-    "(": 0b01011,
-    ")": 0b01100,
-    "[": 0b01101,
-    "]": 0b01110,
-    "{": 0b01111,
-    "}": 0b10000,
-    "/": 0b10001,
-    "\\": 0b10010,
-    "@": 0b10011,
-    "#": 0b10100,
-    "$": 0b10101,
-    "%": 0b10110,
-    "^": 0b10111,
-    "&": 0b11000,
-    "*": 0b11001,
-    "+": 0b11010,
-    "=": 0b11011,
-    "<": 0b11100,
-    ">": 0b11101,
-    "|": 0b11110,
-    "~": 0b11111
-}
-
-reverse_symbol_map = {v: k for k, v in symbol_map.items()}
+# Digits of pi are kept on disk and shared by every run on this host
+PI_CACHE_FILE = os.environ.get(
+    "BLACK_HOLE_53_PI_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "black_hole_53", "pi_digits"),
+)
+PI_CACHE_MIN_DIGITS = 1 << 16
+PI_GUARD_DIGITS = 30
+
+# Bytes XORed with pi per step of the stream
+CHUNK_SIZE = 1 << 20
+
+# Framed files: MAGIC, version, flags, chunk size, then for every chunk
+# its paq length (">I") and bytes, closed by a zero length. Smaller chunks
+# compress a little worse but spread over more workers.
+MAGIC = b"BH53"
+FRAME_VERSION = 1
+FLAG_REVERSE_BITS = 1
+FRAME_HEADER = struct.Struct(">4sBBI")
+FRAME_LENGTH = struct.Struct(">I")
+PAQ_CHUNK_SIZE = 16 << 20
+PAQ_WORKERS = os.cpu_count() or 1
+PAQ_EXECUTOR = "process"  # or "thread"
+
+# ASCII digit -> its value
+DIGIT_VALUES = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+def digits_to_int(digits):
+    # int() of a long ASCII digit string, in halves (int() limits how many it takes)
+    if len(digits) <= 4000:
+        return int(digits)
+    half = len(digits) // 2
+    return digits_to_int(digits[:half]) * 10 ** (len(digits) - half) + digits_to_int(digits[half:])
+
+def mpmath_pi_digits(exact, count):
+    """
+    str(mp.pi)[2:] at mp.dps = count+1, made from exact digits of pi (at
+    least count + PI_GUARD_DIGITS of them). mpmath takes floor(pi * 2**wp)
+    with 20 extra bits, rounds that to its precision and formats the
+    binary value, dropping trailing zeros; this does the same.
+    """
+    exact = bytes(exact[:count + PI_GUARD_DIGITS])
+    with mp.workdps(count + 1):
+        wp = mp.prec + 20
+        fixed = (digits_to_int(b"3" + exact) << wp) // 10 ** len(exact)
+        return str(mp.make_mpf(from_man_exp(fixed, -wp, mp.prec, round_nearest)))[2:].encode("ascii")
+
+class PiDigitCache:
+    """
+    Decimal digits of pi after the point, as ASCII, in a file that only
+    ever grows. Readers memory-map it; a process that needs more digits
+    takes the lock, computes at least twice as many as are stored and
+    appends the new ones, so pi is computed once per host, not per file.
+    """
+
+    def __init__(self, path=PI_CACHE_FILE):
+        self.path = path
+        self.map = None
+        self.size = 0
+
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self.size:
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _grow(self, count):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another process may have grown it while we waited
+                self._remap()
+                if self.size >= count:
+                    return
+                target = max(count, 2 * self.size, PI_CACHE_MIN_DIGITS)
+                # The guard digits keep the last stored digit from being rounded
+                with mp.workdps(target + PI_GUARD_DIGITS):
+                    digits = str(mp.pi)[2:target + 2]
+                with open(self.path, "ab") as f:
+                    f.write(digits[self.size:].encode("ascii"))
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self._remap()
+
+    def raw(self, start, stop):
+        # Exact digits start..stop-1 (0 is the first digit after the point)
+        if self.size < stop:
+            self._remap()
+        if self.size < stop:
+            self._grow(stop)
+        return self.map[start:stop]
+
+    def digits(self, count):
+        """
+        The first count digits as the old generate_pi_digits gave them
+        from str(mp.pi) at mp.dps = count+1, so files written before the
+        cache still decode (see mpmath_pi_digits).
+        """
+        return mpmath_pi_digits(self.raw(0, count + PI_GUARD_DIGITS), count)
+
+    def chunks(self, chunk_size=CHUNK_SIZE, stop=None):
+        # The digits before stop (all of them if None), chunk_size at a time
+        start = 0
+        while stop is None or start < stop:
+            end = start + chunk_size if stop is None else min(start + chunk_size, stop)
+            yield self.raw(start, end)
+            start = end
+
+PI_DIGITS = PiDigitCache()
+
+# Digits of pi from the Gibbons spigot, for when no cache file can be kept
+def pi_spigot_chunks(chunk_size=CHUNK_SIZE):
+    q, r, t, k, n, l = 1, 0, 1, 1, 3, 3
+    digits = bytearray()
+    skip = True
+    while True:
+        if 4 * q + r - t < n * t:
+            if skip:
+                skip = False
+            else:
+                digits.append(48 + n)
+                if len(digits) == chunk_size:
+                    yield bytes(digits)
+                    digits = bytearray()
+            q, r, n = 10 * q, 10 * (r - n * t), (10 * (3 * q + r)) // t - 10 * n
+        else:
+            q, r, t, k, n, l = q * k, (2 * q + r) * l, t * l, k + 1, (q * (7 * k + 2) + r * l) // (t * l), l + 2
+
+def pi_digit_stream(total, chunk_size=CHUNK_SIZE, source=None):
+    """
+    The total digits of pi generate_pi_digits gives, in pieces of about
+    chunk_size. source yields ASCII digit chunks of any size (the cache
+    by default, or pi_spigot_chunks()). The end is formatted by mpmath
+    from the whole prefix, so a custom source has its digits kept.
+    """
+    if total < 1:
+        return
+    prefix = None
+    if source is None:
+        source = PI_DIGITS.chunks(chunk_size, total + PI_GUARD_DIGITS)
+    else:
+        prefix = bytearray()
+    pending = bytearray()
+    sent = 0
+    for piece in source:
+        pending += piece
+        if prefix is not None:
+            prefix += piece
+        while len(pending) > chunk_size and sent + chunk_size < total:
+            # Hold back trailing nines and zeros and the digit before them:
+            # rounding may carry into the nines, and mpmath drops the zeros
+            cut = chunk_size
+            while cut and pending[cut - 1] in b"09":
+                cut -= 1
+            cut -= 1
+            if cut <= 0:
+                break
+            yield bytes(pending[:cut])
+            del pending[:cut]
+            sent += cut
+        if sent + len(pending) >= total + PI_GUARD_DIGITS:
+            break
+    exact = PI_DIGITS.raw(0, total + PI_GUARD_DIGITS) if prefix is None else prefix
+    last = mpmath_pi_digits(exact, total)[sent:]
+    if last:
+        yield last
+
+# XOR a chunk with as many ASCII digits of pi
+def xor_with_pi(chunk, digits):
+    if numpy is not None:
+        values = numpy.frombuffer(digits, dtype=numpy.uint8) - numpy.uint8(48)
+        return (numpy.frombuffer(chunk, dtype=numpy.uint8) ^ values).tobytes()
+    # Without NumPy one big-int XOR still avoids a Python loop per byte
+    return (int.from_bytes(chunk, "big") ^ int.from_bytes(digits.translate(DIGIT_VALUES), "big")).to_bytes(len(chunk), "big")
+
+# XOR total bytes of infile with pi into outfile, one chunk at a time
+def encode_stream(infile, outfile, total, chunk_size=CHUNK_SIZE, source=None):
+    for digits in pi_digit_stream(total, chunk_size, source):
+        chunk = infile.read(len(digits))
+        if len(chunk) != len(digits):
+            raise ValueError("Input ended before the expected length.")
+        outfile.write(xor_with_pi(chunk, digits))
+
+# The same for data already in memory, chunks are memoryview slices of it
+def encode_buffer(data, outfile, chunk_size=CHUNK_SIZE, source=None):
+    view = memoryview(data)
+    position = 0
+    for digits in pi_digit_stream(len(view), chunk_size, source):
+        outfile.write(xor_with_pi(view[position:position + len(digits)], digits))
+        position += len(digits)
+
+class PiXorStream:
+    """
+    XORs consecutive bytes with consecutive digits of pi, for streams
+    whose length is not known up front. The digits are not rounded, which
+    only the framed format relies on.
+    """
+
+    def __init__(self, source=None):
+        self.source = PI_DIGITS.chunks() if source is None else source
+        self.digits = b""
+        self.position = 0
+
+    def xor(self, data):
+        view = memoryview(data)
+        pieces = []
+        while len(view):
+            if self.position == len(self.digits):
+                self.digits = next(self.source)
+                self.position = 0
+            take = min(len(view), len(self.digits) - self.position)
+            pieces.append(xor_with_pi(view[:take], self.digits[self.position:self.position + take]))
+            self.position += take
+            view = view[take:]
+        return b"".join(pieces)
+
+# paq one chunk, in a worker
+def compress_chunk(chunk, reverse_bits_stage=False):
+    compressed = paq.compress(chunk)
+    if reverse_bits_stage:
+        compressed = reverse_bits_in_data(compressed)
+    return compressed
+
+def decompress_chunk(compressed, reverse_bits_stage=False):
+    if reverse_bits_stage:
+        compressed = reverse_bits_in_data(compressed)
+    return paq.decompress(compressed)
+
+def make_executor(workers=PAQ_WORKERS, kind=PAQ_EXECUTOR):
+    if kind == "thread":
+        return concurrent.futures.ThreadPoolExecutor(workers)
+    return concurrent.futures.ProcessPoolExecutor(workers)
+
+# function over items on the pool, results in order, at most 2*workers in flight
+def map_in_order(executor, function, items, workers, *args):
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(function, item, *args))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def read_frames(reader):
+    # Chunks of a framed file after its header; reader(n) returns n bytes
+    while True:
+        length = reader(FRAME_LENGTH.size)
+        if len(length) != FRAME_LENGTH.size:
+            raise ValueError("The file ends inside a frame length.")
+        length, = FRAME_LENGTH.unpack(length)
+        if length == 0:
+            return
+        chunk = reader(length)
+        if len(chunk) != length:
+            raise ValueError("The file ends inside a frame.")
+        yield chunk
 
 # Generate digits of pi
 def generate_pi_digits(digits):
     if digits < 1:
         raise ValueError("The number of digits must be at least 1.")
-    mp.dps = digits + 1
-    pi_value = str(mp.pi)[2:]
-    return pi_value
+    return PI_DIGITS.digits(digits)
 
 # Reverse bits 2-15
 def reverse_bits(byte):
@@ -57,73 +300,83 @@ def reverse_bits(byte):
     reversed_bits = int('{:06b}'.format(relevant_bits)[::-1], 2)
     return (byte & ~mask) | (reversed_bits << 1)
 
+# reverse_bits for every byte value; it is its own inverse
+REVERSE_BITS_TABLE = bytes(reverse_bits(byte) for byte in range(256))
+
 def reverse_bits_in_data(data):
-    return bytes(reverse_bits(byte) for byte in data)
+    return bytes(data).translate(REVERSE_BITS_TABLE)
 
-# XOR encoding with Pi digits
+# XOR encoding with Pi digits (ASCII digits, sliced straight from the cache)
 def encode_with_pi(data, pi_digits):
-    pi_sequence = [int(d) for d in pi_digits[:len(data)]]
-    return bytes([b ^ p for b, p in zip(data, pi_sequence)])
-
-# Convert binary to base 256
-def binary_to_base256(binary_string):
-    if len(binary_string) % 8 != 0:
-        raise ValueError("The binary string length must be a multiple of 8.")
-    
-    byte_chunks = [binary_string[i:i + 8] for i in range(0, len(binary_string), 8)]
-    base256_values = [int(chunk, 2) for chunk in byte_chunks]
-    
-    return base256_values
-
-# Compress and encode using paq and binary to base 256
-def compress_with_zlib_and_encode(input_filename, output_filename):
-    try:
-        # Open the input file and read data
-        with open(input_filename, "rb") as infile:
-            data = infile.read()
-
-        # Compress data using paq
-        compressed_data = paq.compress(data)
+    return xor_with_pi(data, pi_digits[:len(data)])
 
-        # Convert binary data to base 256 (optional, may be useful for processing)
-        binary_data = ''.join(format(byte, '08b') for byte in compressed_data)
-        base256_values = binary_to_base256(binary_data)
+# Compress with paq, optionally reverse bits, then XOR with Pi digits.
+# chunk_size=None writes the old single-block file, which extraction
+# must be given the same reverse_bits_stage for; framed files record it.
+def compress_with_zlib_and_encode(input_filename, output_filename, reverse_bits_stage=False, chunk_size=PAQ_CHUNK_SIZE, workers=PAQ_WORKERS, executor=PAQ_EXECUTOR):
+    try:
+        if chunk_size is None:
+            # Open the input file and read data
+            with open(input_filename, "rb") as infile:
+                data = infile.read()
 
-        # Reverse bits of base256 values
-        reversed_data = bytes(base256_values)
+            # Compress data using paq
+            compressed_data = paq.compress(data)
 
-        # Generate Pi digits for encoding
-        pi_digits = generate_pi_digits(len(reversed_data))
+            # Reverse bits 2-7 of every byte with one table lookup each
+            if reverse_bits_stage:
+                compressed_data = reverse_bits_in_data(compressed_data)
 
-        # XOR encoding with Pi digits
-        encoded_data = encode_with_pi(reversed_data, pi_digits)
+            # XOR encoding with Pi digits, streamed into the output file
+            with open(output_filename, "wb") as outfile:
+                encode_buffer(compressed_data, outfile)
+                print(f"Compressed and encoded file saved to '{output_filename}'.")
+            return
 
-        # Write encoded data to the output file
-        with open(output_filename, "wb") as outfile:
-            outfile.write(encoded_data)
+        # Chunks are paq-compressed on the pool and written in order
+        pi = PiXorStream()
+        flags = FLAG_REVERSE_BITS if reverse_bits_stage else 0
+        with open(input_filename, "rb") as infile, open(output_filename, "wb") as outfile, make_executor(workers, executor) as pool:
+            outfile.write(pi.xor(FRAME_HEADER.pack(MAGIC, FRAME_VERSION, flags, chunk_size)))
+            chunks = iter(lambda: infile.read(chunk_size), b"")
+            for compressed in map_in_order(pool, compress_chunk, chunks, workers, reverse_bits_stage):
+                outfile.write(pi.xor(FRAME_LENGTH.pack(len(compressed))))
+                outfile.write(pi.xor(compressed))
+            outfile.write(pi.xor(FRAME_LENGTH.pack(0)))
             print(f"Compressed and encoded file saved to '{output_filename}'.")
     except Exception as e:
         print(f"An error occurred during compression: {e}")
 
-# Decode and decompress using paq and binary to base 256
-def decode_with_zlib_and_pi(input_filename, output_filename):
+# Undo compress_with_zlib_and_encode: XOR with Pi digits, reverse bits, paq
+def decode_with_zlib_and_pi(input_filename, output_filename, reverse_bits_stage=False, workers=PAQ_WORKERS, executor=PAQ_EXECUTOR):
     try:
-        # Read the encoded data
+        # Framed files are read and decompressed a chunk at a time
+        pi = PiXorStream()
         with open(input_filename, "rb") as infile:
-            encoded_data = infile.read()
-
-        # Generate Pi digits for decoding
-        pi_digits = generate_pi_digits(len(encoded_data))
+            header = pi.xor(infile.read(FRAME_HEADER.size))
+            framed = len(header) == FRAME_HEADER.size and header[:len(MAGIC)] == MAGIC
+            if framed:
+                magic, version, flags, chunk_size = FRAME_HEADER.unpack(header)
+                if version != FRAME_VERSION:
+                    raise ValueError(f"Unknown frame version {version}.")
+                reader = lambda size: pi.xor(infile.read(size))
+                with open(output_filename, "wb") as outfile, make_executor(workers, executor) as pool:
+                    for chunk in map_in_order(pool, decompress_chunk, read_frames(reader), workers, bool(flags & FLAG_REVERSE_BITS)):
+                        outfile.write(chunk)
+                    print(f"Extracted file saved to '{output_filename}'.")
+                return
 
-        # XOR decoding with Pi digits
-        decoded_data = encode_with_pi(encoded_data, pi_digits)
+        # XOR decoding with Pi digits, streamed from the encoded file
+        decoded = io.BytesIO()
+        with open(input_filename, "rb") as infile:
+            encode_stream(infile, decoded, os.path.getsize(input_filename))
+        decoded_data = decoded.getvalue()
 
-        # Convert binary data back from base256 to bytes
-        binary_data = ''.join(format(byte, '08b') for byte in decoded_data)
-        base256_values = binary_to_base256(binary_data)
+        if reverse_bits_stage:
+            decoded_data = reverse_bits_in_data(decoded_data)
 
         # Decompress data using paq
-        decompressed_data = paq.decompress(bytes(base256_values))
+        decompressed_data = paq.decompress(decoded_data)
 
         # Write decompressed data to the output file
         with open(output_filename, "wb") as outfile:
@@ -132,14 +385,27 @@ def decode_with_zlib_and_pi(input_filename, output_filename):
     except Exception as e:
         print(f"An error occurred during extraction: {e}")
 
+# Lengths below stop where the cached digits differ from str(mp.pi) at dps = length+1
+def check_pi_digits(stop=3000, chunk_size=7):
+    mismatches = []
+    for count in range(1, stop):
+        with mp.workdps(count + 1):
+            expected = str(mp.pi)[2:].encode("ascii")
+        streamed = b"".join(pi_digit_stream(count, chunk_size))
+        if PI_DIGITS.digits(count) != expected or streamed != expected:
+            mismatches.append(count)
+    print(f"Digits of pi checked for lengths 1 to {stop - 1}: {len(mismatches)} mismatches {mismatches[:20]}")
+    return mismatches
+
 def main():
     print("Choose an option:")
     print("1. Compress a file")
     print("2. Decode a file")
     print("3. Exit")
+    print("4. Check the digits of pi against mpmath")
 
     while True:
-        choice = input("Enter your choice (1/2/3): ").strip()
+        choice = input("Enter your choice (1/2/3/4): ").strip()
         if choice == '1':
             input_file = input("Enter the name of the file to compress: ").strip()
             output_file = input_file + ".b"
@@ -151,8 +417,10 @@ def main():
         elif choice == '3':
             print("Exiting the program.")
             break
+        elif choice == '4':
+            check_pi_digits()
         else:
-            print("Invalid choice. Please enter 1, 2, or 3.")
+            print("Invalid choice. Please enter 1, 2, 3, or 4.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,6 +7,12 @@ import binascii
 import math
 
 import os.path
+
+import argparse
+
+import hashlib
+
+import json
  
 long_1=0
 
@@ -20,6 +26,174 @@ Square_Root_26_1024_1024=(26*1024*1024)+1
 
 Deep5=Square_Root_26_1024_1024
 
+parser = argparse.ArgumentParser(description="Black Hole search")
+parser.add_argument("--resume", action="store_true", help="continue the search from the last checkpoint")
+parser.add_argument("--checkpoint-every", type=float, default=60.0, help="seconds between checkpoints (default 60)")
+parser.add_argument("--bigint", choices=("auto", "gmpy2", "int"), default="auto", help="big-integer backend for process_files")
+parser.add_argument("--deadline", type=float, default=None, help="seconds the compress search may run before the input is stored as is")
+parser.add_argument("--max-candidates", type=int, default=None, help="candidates the compress search may try before the input is stored as is")
+options, unknown_options = parser.parse_known_args()
+
+def select_bigint_backend(name="auto"):
+        """
+            Returns (backend name, integer type) for the process_files arithmetic.
+            "auto" uses GMP through gmpy2 when it is installed and falls back to
+            the built-in int; "gmpy2" insists on gmpy2 and "int" never uses it.
+            """
+        if name in ("auto", "gmpy2"):
+                try:
+                        import gmpy2
+                        return "gmpy2", gmpy2.mpz
+                except ImportError:
+                        if name == "gmpy2":
+                                raise
+        return "int", int
+
+BIGINT_BACKEND, big_int = select_bigint_backend(options.bigint)
+
+# Written instead of a search result when the budget runs out; a real
+# result has at most 8 leading zero bits, so it never starts like this.
+VERBATIM_MARKER=b"\x00\x00"
+
+def search_budget_exhausted(candidates, started):
+        """True once --max-candidates or --deadline has been used up."""
+        if options.max_candidates is not None and candidates >= options.max_candidates:
+                return True
+        return options.deadline is not None and time() - started >= options.deadline
+
+class PowerOfTwo:
+        """
+            Lazy 2**exponent - offset, with offset 0 or 1.
+            Multiplying by it is a shift and a subtraction and comparisons go
+            by bit length, so the full integer is only built by int() when
+            the value really has to be written out.
+            """
+        __slots__ = ("exponent", "offset")
+
+        def __init__(self, exponent, offset=0):
+                if exponent < 0 or offset not in (0, 1):
+                        raise ValueError("PowerOfTwo needs exponent >= 0 and offset 0 or 1")
+                self.exponent = exponent
+                self.offset = offset
+
+        def __int__(self):
+                return (1 << self.exponent) - self.offset
+
+        __index__ = __int__
+
+        def __repr__(self):
+                return "PowerOfTwo(%d, %d)" % (self.exponent, self.offset)
+
+        def bit_length(self):
+                return self.exponent + 1 - self.offset
+
+        def __mul__(self, other):
+                if isinstance(other, PowerOfTwo):
+                        # (2**a - o)*(2**b - p) = 2**(a+b) - o*2**b - p*2**a + o*p
+                        product = big_int(1) << (self.exponent + other.exponent)
+                        if self.offset:
+                                product -= big_int(1) << other.exponent
+                        if other.offset:
+                                product -= big_int(1) << self.exponent
+                        return product + self.offset * other.offset
+                other = big_int(other)
+                shifted = other << self.exponent
+                return shifted - other if self.offset else shifted
+
+        __rmul__ = __mul__
+
+        def _compare(self, other):
+                if isinstance(other, PowerOfTwo):
+                        other_bits = other.bit_length()
+                else:
+                        if other < 0:
+                                return 1
+                        other_bits = other.bit_length()
+                bits = self.bit_length()
+                if bits != other_bits:
+                        return -1 if bits < other_bits else 1
+                # Same size: building the value costs no more than other already does
+                value = int(self)
+                other = int(other)
+                return (value > other) - (value < other)
+
+        def __eq__(self, other):
+                return self._compare(other) == 0
+
+        def __ne__(self, other):
+                return self._compare(other) != 0
+
+        def __lt__(self, other):
+                return self._compare(other) < 0
+
+        def __le__(self, other):
+                return self._compare(other) <= 0
+
+        def __gt__(self, other):
+                return self._compare(other) > 0
+
+        def __ge__(self, other):
+                return self._compare(other) >= 0
+
+        def __hash__(self):
+                return hash(int(self))
+
+def power_of_two(exponent, offset=0):
+        """2**exponent - offset, lazy for the exponents the searches use."""
+        if exponent < 0:
+                return 2**exponent - offset
+        return PowerOfTwo(exponent, offset)
+
+def multiply_big(a, b):
+        """a*b on the big-integer backend; a lazy power of two turns it into shifts."""
+        if isinstance(a, PowerOfTwo):
+                return a * b
+        if isinstance(b, PowerOfTwo):
+                return b * a
+        return big_int(a) * b
+
+def checkpoint_id(script, mode, INFO):
+        """Identifies a search: the script, compress/extract and the input bits."""
+        return script + ":" + str(mode) + ":" + hashlib.sha256(INFO.encode()).hexdigest()
+
+def save_checkpoint(path, search_id, state):
+        """
+            Writes the search state atomically: the state goes to a temporary
+            file which is then renamed over the previous checkpoint.
+            Integers are stored as hex because they can be far too long
+            for a decimal conversion.
+            """
+        ints = {}
+        strs = {}
+        for key, value in state.items():
+                if isinstance(value, str):
+                        strs[key] = value
+                else:
+                        ints[key] = hex(value)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+                json.dump({"id": search_id, "ints": ints, "strs": strs}, f)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+def load_checkpoint(path, search_id):
+        """Returns the saved state, or None if there is no checkpoint for this search."""
+        if not os.path.exists(path):
+                return None
+        with open(path) as f:
+                saved = json.load(f)
+        if saved.get("id") != search_id:
+                print("Checkpoint", path, "belongs to another search, starting over.")
+                return None
+        state = {key: int(value, 16) for key, value in saved["ints"].items()}
+        state.update(saved["strs"])
+        return state
+
+def remove_checkpoint(path):
+        if os.path.exists(path):
+                os.remove(path)
+
 
 print("Created by Jurijus Pacalovas.")
 
@@ -68,13 +242,14 @@ class compression:
                         Square_Root_26_1024_1024-=1     
 
                         if Number_of_the_file>=2**26*1024*1024:
-                           Number_of_the_file=2**Square_Root_26_1024_1024
+                           Number_of_the_file=power_of_two(Square_Root_26_1024_1024)
                         if Square_Root_26_1024_1024==2:
                                 
-                           Number_of_the_file=2**Square_Root_26_1024_1024                                
+                           Number_of_the_file=power_of_two(Square_Root_26_1024_1024)
                         
 
-                        Number_of_the_file =((((Number_of_the_file * Square_of_ROOT) + Add_Numbers) // 3) * Multiply)
+                        # The multiply and floor divide run on the selected big-integer backend
+                        Number_of_the_file =int((((multiply_big(Number_of_the_file, Square_of_ROOT)) + Add_Numbers) // 3) * Multiply)
                         #print(Number_of_the_file)
 
                         F=0
@@ -216,6 +391,16 @@ class compression:
 
                         	 raise SystemExit
 
+                        if i==2 and data[:2]==VERBATIM_MARKER:
+
+                                # The compress search ran out of budget and stored the input as is
+
+                                with open(name[:len(name)-4], "wb") as f2:
+
+                                        f2.write(data[2:])
+
+                                return str(time()-x)
+
                         END_working=0
 
                         File_information6_Times2=0
@@ -385,8 +570,71 @@ class compression:
                                     num=0
                                     result=0
 
+                                    Checkpoint_name=name+".ckpt"
+
+                                    Checkpoint_id=checkpoint_id("Black_Hole_56", i, INFO)
+
+                                    Checkpoint_time=time()
+
+                                    State=None
+
+                                    if options.resume:
+
+                                            State=load_checkpoint(Checkpoint_name, Checkpoint_id)
+
+                                    if State is not None:
+
+                                            k1=State["k1"]
+                                            k2=State["k2"]
+                                            X1=State["X1"]
+                                            counts=State["counts"]
+                                            y=State["y"]
+                                            Times_12=State["Times_12"]
+                                            University=State["University"]
+                                            universe_n=State["universe_n"]
+                                            Deep5=State["Deep5"]
+                                            Square_Root_26_1024_1024=State["Square_Root_26_1024_1024"]
+                                            Number_of_the_file=State["Number_of_the_file"]
+                                            File_information6_Times2=State["File_information6_Times2"]
+                                            File_information6_Times2_1=State["File_information6_Times2_1"]
+                                            File_information5_2=State["File_information5_2"]
+
+                                            print("Resumed from checkpoint at k2 =", k2)
+
+                                    Candidates=0
+
                                     while Extract1!=1:
 
+                                            if k2>=0 and time()-Checkpoint_time>=options.checkpoint_every:
+
+                                                    save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "universe_n": universe_n, "Deep5": Deep5, "Square_Root_26_1024_1024": Square_Root_26_1024_1024, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    Checkpoint_time=time()
+
+                                            if search_budget_exhausted(Candidates, x):
+
+                                                    # Out of budget: no candidate so far decodes to the input, so store it
+                                                    # verbatim and keep a checkpoint for a later --resume.
+                                                    if k2>=0:
+
+                                                            save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "universe_n": universe_n, "Deep5": Deep5, "Square_Root_26_1024_1024": Square_Root_26_1024_1024, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    print("Search budget used up after", Candidates, "candidates: k2 =", k2, "X1 =", X1)
+
+                                                    print("Covered %.3g%% of the 2**40 (Times_12, Multiply, Add_Numbers, SQUARE_OF_ROOT, Multiply_Times) tuples" % (100.0*(k2+1)/2**40))
+
+                                                    name=name+".bin"
+
+                                                    with open(name, "wb") as f2:
+
+                                                        f2.write(VERBATIM_MARKER+data)
+
+                                                    print("Stored", name, "verbatim")
+
+                                                    return str(time()-x)
+
+                                            Candidates+=1
+
                                             k1+=1
 
                                             k2+=1
@@ -649,13 +897,13 @@ class compression:
 
                                                         if Deep5<=26*1024*1024:
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         else:
 
                                                                 Deep5=Square_Root_26_1024_1024
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                                 
 
@@ -795,6 +1043,8 @@ class compression:
 
                                             xs=str(xs)
 
+                                            remove_checkpoint(Checkpoint_name)
+
                                             return xs;
 
 
@@ -909,8 +1159,45 @@ class compression:
                                     result=0
                                   
 
+                                    Checkpoint_name=name+".ckpt"
+
+                                    Checkpoint_id=checkpoint_id("Black_Hole_56", i, INFO)
+
+                                    Checkpoint_time=time()
+
+                                    State=None
+
+                                    if options.resume:
+
+                                            State=load_checkpoint(Checkpoint_name, Checkpoint_id)
+
+                                    if State is not None:
+
+                                            k1=State["k1"]
+                                            k2=State["k2"]
+                                            X1=State["X1"]
+                                            counts=State["counts"]
+                                            y=State["y"]
+                                            Times_12=State["Times_12"]
+                                            University=State["University"]
+                                            universe_n=State["universe_n"]
+                                            Deep5=State["Deep5"]
+                                            Square_Root_26_1024_1024=State["Square_Root_26_1024_1024"]
+                                            Number_of_the_file=State["Number_of_the_file"]
+                                            File_information6_Times2=State["File_information6_Times2"]
+                                            File_information6_Times2_1=State["File_information6_Times2_1"]
+                                            File_information5_2=State["File_information5_2"]
+
+                                            print("Resumed from checkpoint at k2 =", k2)
+
                                     while Extract1!=1:
 
+                                            if k2>=0 and time()-Checkpoint_time>=options.checkpoint_every:
+
+                                                    save_checkpoint(Checkpoint_name, Checkpoint_id, {"k1": k1, "k2": k2, "X1": X1, "counts": counts, "y": y, "Times_12": Times_12, "University": University, "universe_n": universe_n, "Deep5": Deep5, "Square_Root_26_1024_1024": Square_Root_26_1024_1024, "Number_of_the_file": Number_of_the_file, "File_information6_Times2": File_information6_Times2, "File_information6_Times2_1": File_information6_Times2_1, "File_information5_2": File_information5_2})
+
+                                                    Checkpoint_time=time()
+
                                             k1+=1
 
                                             k2+=1
@@ -1178,19 +1465,19 @@ class compression:
 
                                                             Number_of_the_file=0
 
-                                                        Hole_Number_information=(2**Deep5)-1
+                                                        Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         Square_of_ROOT=Hole_Number_information
 
                                                         if Deep5<=26*1024*1024:
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         else:
 
                                                                 Deep5=Square_Root_26_1024_1024
 
-                                                                Hole_Number_information=(2**Deep5)-1
+                                                                Hole_Number_information=power_of_two(Deep5, 1)
 
                                                         Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts, Square_Root_26_1024_1024= process_files(Number_of_the_file, Hole_Number_information, Add_Numbers, Multiply, counts,Square_Root_26_1024_1024)
 
@@ -1278,6 +1565,8 @@ class compression:
 
                                             xs=str(xs)
 
+                                            remove_checkpoint(Checkpoint_name)
+
                                             return xs;
 
 d=compression()
@@ -1,7 +1,21 @@
 import random
 import os
+import json
+import hashlib
+import sqlite3
+import time
+import struct
+import math
+import zlib
+import multiprocessing
+import tempfile
 import paq  # Ensure PAQ module is available
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # 1. Reverse chunks function
 def reverse_chunks(data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
@@ -25,6 +39,18 @@ def compress_strategy_3(data):
 # 4. Function to move bits left or right in the data
 def function_move(data, direction, num_bits):
     """Moves bits left or right in the data."""
+    length = len(data) * 8
+    # Where the old bit-string slices cut, including their clamping of
+    # out-of-range counts, as a left rotation of the whole buffer
+    cut = num_bits if direction == 'left' else -num_bits
+    shift = slice(None, cut).indices(length)[1] % max(1, length)
+    number = int.from_bytes(data, "big")
+    if shift:
+        number = ((number << shift) | (number >> (length - shift))) & ((1 << length) - 1)
+    return bytearray(number.to_bytes(len(data), "big"))
+
+def function_move_bits(data, direction, num_bits):
+    """The bit-string form of function_move, kept to check and time it against."""
     bit_string = ''.join(f'{byte:08b}' for byte in data)
     if direction == 'left':
         bit_string = bit_string[num_bits:] + bit_string[:num_bits]
@@ -32,20 +58,107 @@ def function_move(data, direction, num_bits):
         bit_string = bit_string[-num_bits:] + bit_string[:-num_bits]
     return bytearray(int(bit_string[i:i + 8], 2) for i in range(0, len(bit_string), 8))
 
+# Unsigned LEB128 varints: 7 bits per byte, high bit set on all but the last
+def encode_varints(numbers):
+    """Varints of non-negative numbers, back to back."""
+    if numpy is not None:
+        numbers = numpy.asarray(numbers, dtype=numpy.uint64)
+        if not len(numbers):
+            return b""
+        largest = int(numbers.max())
+        if largest < 0x80:
+            return numbers.astype(numpy.uint8).tobytes()  # One byte each
+        sizes = numpy.ones(len(numbers), dtype=numpy.int64)
+        for group in range(1, (largest.bit_length() + 6) // 7):
+            sizes += numbers >= numpy.uint64(1 << (7 * group))
+        starts = numpy.cumsum(sizes) - sizes
+        encoded = numpy.empty(int(starts[-1] + sizes[-1]), dtype=numpy.uint8)
+        # Every number has a first group; later groups only the larger ones
+        encoded[starts] = (numbers & numpy.uint64(0x7F)).astype(numpy.uint8) | ((sizes > 1).astype(numpy.uint8) << numpy.uint8(7))
+        present = numpy.flatnonzero(sizes > 1)
+        group = 1
+        while len(present):
+            bits = (numbers[present] >> numpy.uint64(7 * group)) & numpy.uint64(0x7F)
+            more = sizes[present] > group + 1
+            encoded[starts[present] + group] = bits.astype(numpy.uint8) | (more.astype(numpy.uint8) << numpy.uint8(7))
+            present = present[more]
+            group += 1
+        return encoded.tobytes()
+    encoded = bytearray()
+    for number in numbers:
+        number = int(number)
+        while number > 0x7F:
+            encoded.append((number & 0x7F) | 0x80)
+            number >>= 7
+        encoded.append(number)
+    return bytes(encoded)
+
+def decode_varints(data, count, offset=0):
+    """count varints from data[offset:]; returns (numbers, offset after them)."""
+    if count == 0:
+        return [], offset
+    if numpy is not None:
+        buffer = numpy.frombuffer(data, dtype=numpy.uint8)[offset:]
+        ends = numpy.flatnonzero(buffer < 0x80)[:count]
+        if len(ends) < count:
+            raise ValueError("Data ends inside a varint.")
+        end = int(ends[-1]) + 1
+        if end == count:
+            return buffer[:count].astype(numpy.uint64), offset + end  # One byte each
+        starts = numpy.concatenate(([0], ends[:-1] + 1))
+        groups = numpy.arange(end) - numpy.repeat(starts, ends - starts + 1)
+        bits = (buffer[:end] & 0x7F).astype(numpy.uint64) << (7 * groups).astype(numpy.uint64)
+        return numpy.add.reduceat(bits, starts), offset + end
+    numbers = []
+    for _ in range(count):
+        number = shift = 0
+        while True:
+            if offset >= len(data):
+                raise ValueError("Data ends inside a varint.")
+            byte = data[offset]
+            offset += 1
+            number |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        numbers.append(number)
+    return numbers, offset
+
+def true_runs(flags, length):
+    """(starts, ends) of the runs of True in flags, a NumPy bool array or a list."""
+    if numpy is not None:
+        edges = numpy.diff(numpy.concatenate(([0], numpy.asarray(flags, dtype=numpy.int8), [0])))
+        return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+    starts, ends = [], []
+    for i in range(length):
+        if flags[i] and (i == 0 or not flags[i - 1]):
+            starts.append(i)
+        if flags[i] and (i + 1 == length or not flags[i + 1]):
+            ends.append(i + 1)
+    return starts, ends
+
 # 5. Apply run-length encoding for repeated sequences
 def apply_run_length_encoding(data):
-    """A simple run-length encoding (RLE) for repeated sequences of bytes."""
-    compressed_data = bytearray()
-    i = 0
-    while i < len(data):
-        count = 1
-        while i + 1 < len(data) and data[i] == data[i + 1]:
-            i += 1
-            count += 1
-        compressed_data.append(data[i])
-        compressed_data.append(count)
-        i += 1
-    return bytes(compressed_data)
+    """Run-length encoding: the number of runs, their bytes, then their lengths, all counts as varints."""
+    length = len(data)
+    if numpy is not None:
+        values = numpy.frombuffer(bytes(data), dtype=numpy.uint8)
+        starts = numpy.concatenate(([0], numpy.flatnonzero(values[1:] != values[:-1]) + 1)) if length else numpy.zeros(0, dtype=numpy.int64)
+        counts = numpy.diff(numpy.concatenate((starts, [length])))
+        return encode_varints([len(starts)]) + values[starts].tobytes() + encode_varints(counts)
+    starts = [i for i in range(length) if i == 0 or data[i] != data[i - 1]]
+    counts = [end - start for start, end in zip(starts, starts[1:] + [length])]
+    return encode_varints([len(starts)]) + bytes(data[i] for i in starts) + encode_varints(counts)
+
+def undo_run_length_encoding(data):
+    """Expands the runs written by apply_run_length_encoding."""
+    (runs,), offset = decode_varints(data, 1)
+    runs = int(runs)
+    values = data[offset:offset + runs]
+    counts, offset = decode_varints(data, runs, offset + runs)
+    if numpy is not None:
+        return numpy.repeat(numpy.frombuffer(bytes(values), dtype=numpy.uint8), numpy.asarray(counts, dtype=numpy.int64)).tobytes()
+    return b"".join(bytes([value]) * int(count) for value, count in zip(values, counts))
 
 # 6. Compress data with PAQ
 def compress_data(data):
@@ -60,15 +173,30 @@ def compress_data(data):
 
 # 7. Decompress data with byte restoration
 def decompress_data(compressed_data, last_byte):
-    """Restores the last byte and decompresses the data."""
-    compressed_data = compressed_data[:-1]  # Remove the extra byte
+    """Removes the extra byte, checks the last byte and decompresses the data."""
     modified_last_byte = compressed_data[-1]
-    compressed_data = compressed_data[:-1] + bytes([modified_last_byte ^ 0xFF])  # Restore the last byte
+    compressed_data = compressed_data[:-1]  # Remove the extra byte (the last byte XOR 0xFF)
+    if modified_last_byte ^ 0xFF != last_byte or compressed_data[-1] != last_byte:
+        raise ValueError("The stored last byte does not match the compressed data.")
     return paq.decompress(compressed_data)  # Using PAQ decompression
 
 # 8. Strategy 7: Compress length of bits (0-2^28) for zeros, and add last byte from the original file
+# Set bits in every byte value
+POPCOUNT_TABLE = bytes(bin(value).count('1') for value in range(256))
+
 def strategy_7(data, last_byte_from_file):
     """Compresses long sequences of zeros and adds the last byte from the original file."""
+    # Without its zeros the bit string is just the set bits: 0xFF per eight of
+    # them and one byte holding the rest
+    ones = sum(bytes(data).translate(POPCOUNT_TABLE))
+    compressed_data = bytearray(b'\xff' * (ones // 8))
+    if ones % 8:
+        compressed_data.append((1 << (ones % 8)) - 1)
+    compressed_data.append(last_byte_from_file)  # Add the last byte from the original file
+    return bytes(compressed_data)
+
+def strategy_7_bits(data, last_byte_from_file):
+    """The bit-string form of strategy_7, kept to check and time it against."""
     bit_string = ''.join(f'{byte:08b}' for byte in data)
     compressed_data = bit_string.replace('0', '')  # Removing zeros to compress zero sequences
     compressed_data = bytearray(int(compressed_data[i:i + 8], 2) for i in range(0, len(compressed_data), 8))
@@ -76,86 +204,631 @@ def strategy_7(data, last_byte_from_file):
     return bytes(compressed_data)
 
 # 9. Strategy 8: Compress repeated sequences longer than 4 bytes
+# Stretches where every byte equals the one 4 before it, at least this long
+MIN_PERIOD_RUN = 16
+
 def strategy_8(data):
-    """Compress sequences of more than 4 bytes that repeat."""
-    i = 0
-    compressed_data = bytearray()
-    while i < len(data):
-        count = 1
-        while i + 1 < len(data) and data[i:i+4] == data[i+1:i+5]:  # Checking for 4-byte sequences
-            i += 4
-            count += 1
-        if count > 1:
-            compressed_data.append(count)
-            compressed_data.extend(data[i:i+4])
+    """
+    Compress sequences of more than 4 bytes that repeat: the number of
+    tokens, every token's literal length and repeat length as varints, then
+    per token its literal bytes and, if it repeats, the 4-byte pattern.
+    """
+    data = bytes(data)
+    length = len(data)
+    if numpy is not None:
+        values = numpy.frombuffer(data, dtype=numpy.uint8)
+        same = values[4:] == values[:-4] if length > 4 else numpy.zeros(0, dtype=bool)
+    else:
+        same = [data[i] == data[i + 4] for i in range(length - 4)]
+    starts, ends = true_runs(same, max(0, length - 4))
+    literals, repeats, body = [], [], []
+    position = 0
+    for start, end in zip(starts, ends):
+        # same[start:end] holds, so data[start:end + 4] repeats its first 4 bytes
+        start, end = max(int(start), position), int(end) + 4
+        if end - start < MIN_PERIOD_RUN:
+            continue
+        literals.append(start - position)
+        repeats.append(end - start)
+        body.append(data[position:start])
+        body.append(data[start:start + 4])
+        position = end
+    literals.append(length - position)
+    repeats.append(0)
+    body.append(data[position:])
+    return encode_varints([len(literals)]) + encode_varints(literals) + encode_varints(repeats) + b"".join(body)
+
+def undo_strategy_8(data):
+    """Rebuilds the data strategy_8 encoded."""
+    (tokens,), offset = decode_varints(data, 1)
+    literals, offset = decode_varints(data, int(tokens), offset)
+    repeats, offset = decode_varints(data, int(tokens), offset)
+    restored = []
+    for literal, repeat in zip(literals, repeats):
+        literal, repeat = int(literal), int(repeat)
+        restored.append(data[offset:offset + literal])
+        offset += literal
+        if repeat:
+            pattern = data[offset:offset + 4]
+            offset += 4
+            restored.append((pattern * (repeat // 4 + 1))[:repeat])
+    return b"".join(restored)
+
+# 10. Strategy registry: every entry is (name, forward, inverse, make_params) and
+# forward / inverse share the signature strategy(data, params). Only transforms
+# that can be undone are listed; strategy_7 drops bits.
+def reverse_chunk_positions(length, params):
+    """The chunk positions reverse_chunks uses, rebuilt from the recorded seed."""
+    chunks = length // params["chunk_size"]
+    return sorted(random.Random(params["seed"]).sample(range(chunks), min(params["count"], chunks)))
+
+def strategy_identity(data, params):
+    return bytes(data)
+
+def strategy_reverse_chunks(data, params):
+    return reverse_chunks(data, params["chunk_size"], reverse_chunk_positions(len(data), params))
+
+def strategy_random_bytes(data, params):
+    rng = random.Random(params["seed"])
+    return bytes(data) + bytes(rng.getrandbits(8) for _ in range(params["num_bytes"]))
+
+def undo_random_bytes(data, params):
+    return bytes(data[:len(data) - params["num_bytes"]])
+
+def strategy_subtract_one(data, params):
+    # compress_strategy_3 clamps 0 and so loses it; this wraps to keep it
+    return bytes((x - 1) & 0xFF for x in data)
+
+def undo_subtract_one(data, params):
+    return bytes((x + 1) & 0xFF for x in data)
+
+def strategy_move(data, params):
+    if not data:
+        return b""
+    return bytes(function_move(data, params["direction"], params["num_bits"] % (len(data) * 8)))
+
+def undo_move(data, params):
+    direction = "right" if params["direction"] == "left" else "left"
+    return strategy_move(data, {"direction": direction, "num_bits": params["num_bits"]})
+
+def strategy_run_length(data, params):
+    return apply_run_length_encoding(data)
+
+def undo_run_length(data, params):
+    return undo_run_length_encoding(data)
+
+def strategy_period_runs(data, params):
+    return strategy_8(data)
+
+def undo_period_runs(data, params):
+    return undo_strategy_8(data)
+
+def no_params(length, rng):
+    return {}
+
+def reverse_chunks_params(length, rng):
+    chunk_size = rng.randint(1, 256)
+    return {"chunk_size": chunk_size, "seed": rng.getrandbits(32), "count": rng.randint(0, length // chunk_size)}
+
+def random_bytes_params(length, rng):
+    return {"num_bytes": rng.randint(1, 16), "seed": rng.getrandbits(32)}
+
+def move_params(length, rng):
+    return {"direction": rng.choice(["left", "right"]), "num_bits": rng.randint(1, 15)}
+
+STRATEGIES = {
+    0: ("identity", strategy_identity, strategy_identity, no_params),
+    1: ("reverse_chunks", strategy_reverse_chunks, strategy_reverse_chunks, reverse_chunks_params),
+    2: ("random_bytes", strategy_random_bytes, undo_random_bytes, random_bytes_params),
+    3: ("compress_strategy_3", strategy_subtract_one, undo_subtract_one, no_params),
+    4: ("function_move", strategy_move, undo_move, move_params),
+    5: ("run_length", strategy_run_length, undo_run_length, no_params),
+    6: ("strategy_8", strategy_period_runs, undo_period_runs, no_params),
+}
+
+# Seconds the strategy search may take before running trials are dropped
+SEARCH_BUDGET = 300.0
+
+# Tiered estimate: order-0 entropy ranks every trial, zlib level 1 on a sample
+# ranks the best ENTROPY_KEEP of those, and only the best PAQ_TOP_K get PAQ
+ENTROPY_KEEP = 8
+PAQ_TOP_K = 2
+SAMPLE_SIZE = 256 * 1024
+SAMPLE_PIECES = 8
+
+def order0_entropy_size(data):
+    """Bytes an order-0 entropy coder would need for data."""
+    if not data:
+        return 0.0
+    if numpy is not None:
+        counts = numpy.bincount(numpy.frombuffer(data, dtype=numpy.uint8), minlength=256)
+        counts = counts[counts > 0].astype(numpy.float64)
+        return float(-(counts * numpy.log2(counts / len(data))).sum() / 8)
+    counts = [data.count(bytes([value])) for value in range(256)]
+    return -sum(count * math.log2(count / len(data)) for count in counts if count) / 8
+
+def sample_of(data, sample_size=SAMPLE_SIZE, pieces=SAMPLE_PIECES):
+    """Evenly spaced slices of data, sample_size bytes in all."""
+    if len(data) <= sample_size:
+        return bytes(data)
+    piece = sample_size // pieces
+    step = (len(data) - piece) // (pieces - 1)
+    return b"".join(data[i * step:i * step + piece] for i in range(pieces))
+
+def zlib_sample_size(data):
+    """Bytes zlib level 1 would need for data, judged from a sample."""
+    sample = sample_of(data)
+    if not sample:
+        return 0.0
+    return len(zlib.compress(sample, 1)) * len(data) / len(sample)
+
+# Data the pool workers share, set once per worker instead of per trial
+TRIAL_DATA = b""
+
+def init_trial(data):
+    global TRIAL_DATA
+    TRIAL_DATA = data
+
+def estimate_trial(strategy_id, params):
+    """Applies one strategy to TRIAL_DATA and returns both cheap size estimates."""
+    transformed_data = STRATEGIES[strategy_id][1](TRIAL_DATA, params)
+    return strategy_id, params, order0_entropy_size(transformed_data), zlib_sample_size(transformed_data)
+
+def run_trial(strategy_id, params):
+    """Applies one strategy to TRIAL_DATA and compresses it with PAQ."""
+    transformed_data = STRATEGIES[strategy_id][1](TRIAL_DATA, params)
+    return strategy_id, params, paq.compress(transformed_data)
+
+# What a chunk may pick from on its own: everything but random_bytes
+CHUNK_STRATEGIES = (0, 1, 3, 4, 5, 6)
+
+def make_trials(length, attempts, iterations, rng, strategy_ids=None):
+    """(strategy_id, params) to try: identity once, attempts draws of the rest."""
+    trials = [(0, {})]
+    for strategy_id, (name, forward, inverse, make_params) in STRATEGIES.items():
+        if strategy_ids is not None and strategy_id not in strategy_ids:
+            continue
+        if make_params is no_params:
+            if strategy_id != 0:
+                trials.append((strategy_id, {}))
+            continue
+        for _ in range(max(1, attempts)):
+            trials.append((strategy_id, make_params(length, rng)))
+    return trials[:max(1, iterations)]
+
+def collect(pending, deadline):
+    """Results of the async calls that finish before deadline."""
+    results = []
+    for result in pending:
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            results.append(result.get(timeout))
+        except multiprocessing.TimeoutError:
+            continue  # Over budget: whatever is still running loses
+    return results
+
+def rank_trials(estimates, top_k=PAQ_TOP_K, entropy_keep=ENTROPY_KEEP):
+    """The top_k trials by the zlib estimate among the entropy_keep best by entropy."""
+    by_entropy = sorted(estimates, key=lambda estimate: estimate[2])[:max(top_k, entropy_keep)]
+    by_zlib = sorted(by_entropy, key=lambda estimate: estimate[3])[:top_k]
+    return [(strategy_id, params) for strategy_id, params, entropy_size, zlib_size in by_zlib]
+
+# Trial results kept on disk between runs, keyed by chunk hash and strategy
+TRIAL_CACHE_FILE = os.environ.get(
+    "BLACK_HOLE_90_TRIAL_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "black_hole_90", "trials.sqlite"),
+)
+TRIAL_CACHE_MAX_ENTRIES = 100000
+
+class TrialCache:
+    """
+    Best PAQ length and parameters per (chunk hash, strategy) in SQLite.
+    A length of None means the strategy lost on the estimates. Every read
+    stamps the entry, and past max_entries the least recently used go.
+    """
+
+    def __init__(self, path=TRIAL_CACHE_FILE, max_entries=TRIAL_CACHE_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("CREATE TABLE IF NOT EXISTS trials (key TEXT PRIMARY KEY, length INTEGER, params TEXT, used REAL)")
+        self.db.commit()
+
+    def get(self, key):
+        """(length, params) stored under key, or None."""
+        row = self.db.execute("SELECT length, params FROM trials WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE trials SET used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key, length, params):
+        self.db.execute("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?)", (key, length, json.dumps(params), time.time()))
+        count, = self.db.execute("SELECT COUNT(*) FROM trials").fetchone()
+        if count > self.max_entries:
+            self.db.execute("DELETE FROM trials WHERE key IN (SELECT key FROM trials ORDER BY used LIMIT ?)", (count - self.max_entries,))
+        self.db.commit()
+
+    def hit_rate(self):
+        return self.hits / max(1, self.hits + self.misses)
+
+    def report(self):
+        print(f"Trial cache: {self.hits} hits, {self.misses} misses (hit rate {self.hit_rate():.1%})")
+
+    def close(self):
+        self.db.close()
+
+# 11. Find the best compression strategy by applying various strategies
+def find_best_strategy(data, attempts=1, iterations=100, budget=SEARCH_BUDGET, workers=None,
+                       top_k=PAQ_TOP_K, strategy_ids=None, cache=None):
+    """
+    Tries every strategy (or those in strategy_ids) in a process pool with
+    attempts random parameter sets each (identity once), at most iterations
+    trials in all. The cheap estimates pick top_k trials for the full PAQ
+    run. Trials still running after budget seconds lose and are
+    terminated with the pool, so nothing outlives the call. With a
+    TrialCache, strategies already tried on this data are not tried
+    again; the best of them joins the PAQ run instead.
+    Returns (strategy_id, params, compressed_data, compression_ratio).
+    """
+    trials = make_trials(len(data), attempts, iterations, random.Random(), strategy_ids)
+
+    cached = {}
+    if cache is not None:
+        digest = hashlib.sha256(data).hexdigest()
+        for strategy_id in sorted({strategy_id for strategy_id, params in trials}):
+            entry = cache.get(f"{digest}:{strategy_id}")
+            if entry is not None:
+                cached[strategy_id] = entry
+        trials = [trial for trial in trials if trial[0] not in cached]
+    known = [(length, strategy_id, params) for strategy_id, (length, params) in cached.items() if length is not None]
+    finalists = [min(known, key=lambda entry: entry[0])[1:]] if known else []
+
+    best = None
+    if not trials and finalists:
+        # Everything is cached: only the winner is compressed, in this process
+        strategy_id, params = finalists[0]
+        best = (strategy_id, params, paq.compress(STRATEGIES[strategy_id][1](data, params)))
+        trials = finalists = []
+    deadline = None if budget is None else time.time() + budget
+    pool = multiprocessing.Pool(workers, init_trial, (data,)) if trials or finalists else None
+    estimates = []
+    results = []
+    try:
+        if len(trials) > top_k:
+            estimates = collect([pool.apply_async(estimate_trial, trial) for trial in trials], deadline)
+            trials = rank_trials(estimates, top_k) or ([] if finalists else [(0, {})])
+        trials += [trial for trial in finalists if trial not in trials]
+        results = collect([pool.apply_async(run_trial, trial) for trial in trials], deadline)
+        for strategy_id, params, compressed_data in results:
+            if best is None or len(compressed_data) < len(best[2]):
+                best = (strategy_id, params, compressed_data)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if cache is not None:
+        # Per strategy the shortest PAQ result; strategies only estimated lost
+        found = {strategy_id: None for strategy_id, params, entropy_size, zlib_size in estimates}
+        for strategy_id, params, compressed_data in results:
+            if found.get(strategy_id) is None or len(compressed_data) < found[strategy_id][0]:
+                found[strategy_id] = (len(compressed_data), params)
+        for strategy_id, entry in found.items():
+            cache.put(f"{digest}:{strategy_id}", *(entry or (None, {})))
+
+    if best is None:
+        best = (0, {}, paq.compress(data))  # Nothing finished in time
+    strategy_id, params, compressed_data = best
+    return strategy_id, params, compressed_data, len(compressed_data) / max(1, len(data))
+
+def rank_correlation(first, second):
+    """Spearman correlation of two equally long lists of numbers."""
+    def ranks(values):
+        order = sorted(range(len(values)), key=lambda i: values[i])
+        result = [0] * len(values)
+        for rank, i in enumerate(order):
+            result[i] = rank
+        return result
+    n = len(first)
+    if n < 2:
+        return 1.0
+    first, second = ranks(first), ranks(second)
+    return 1 - 6 * sum((a - b) ** 2 for a, b in zip(first, second)) / (n * (n * n - 1))
+
+# Calibration benchmark: how well the cheap estimates rank trials against PAQ
+def calibrate_estimator(data, attempts=3, top_k=PAQ_TOP_K, workers=None):
+    trials = make_trials(len(data), attempts, len(STRATEGIES) * max(1, attempts), random.Random())
+    pool = multiprocessing.Pool(workers, init_trial, (data,))
+    try:
+        started = time.time()
+        estimates = collect([pool.apply_async(estimate_trial, trial) for trial in trials], None)
+        estimate_time = time.time() - started
+        started = time.time()
+        actual = collect([pool.apply_async(run_trial, trial) for trial in trials], None)
+        paq_time = time.time() - started
+    finally:
+        pool.terminate()
+        pool.join()
+
+    paq_sizes = [len(compressed_data) for strategy_id, params, compressed_data in actual]
+    entropy_sizes = [estimate[2] for estimate in estimates]
+    zlib_sizes = [estimate[3] for estimate in estimates]
+    for (strategy_id, params, entropy_size, zlib_size), paq_size in zip(estimates, paq_sizes):
+        print(f"{STRATEGIES[strategy_id][0]:>20} entropy {entropy_size:12.0f} zlib-1 {zlib_size:12.0f} paq {paq_size:10d} {params}")
+    chosen = rank_trials(estimates, top_k)
+    best = min(range(len(actual)), key=lambda i: paq_sizes[i])
+    print(f"Rank correlation with PAQ: entropy {rank_correlation(entropy_sizes, paq_sizes):.3f}, zlib-1 sample {rank_correlation(zlib_sizes, paq_sizes):.3f}")
+    chosen_best = min(paq_size for (strategy_id, params, compressed_data), paq_size in zip(actual, paq_sizes) if (strategy_id, params) in chosen)
+    print(f"Best PAQ size in the estimated top {top_k}: {chosen_best} against {paq_sizes[best]} overall ({100.0 * (chosen_best - paq_sizes[best]) / max(1, paq_sizes[best]):+.2f}%)")
+    print(f"Estimates took {estimate_time:.2f} s, PAQ on every trial took {paq_time:.2f} s")
+
+# 12. Header of a compressed file: magic, strategy id, parameters as JSON
+MAGIC = b"BH90"
+HEADER = struct.Struct(">4sBI")
+
+def write_header(outfile, strategy_id, params):
+    params_json = json.dumps(params, separators=(",", ":")).encode("utf-8")
+    outfile.write(HEADER.pack(MAGIC, strategy_id, len(params_json)))
+    outfile.write(params_json)
+
+def read_header(data):
+    """Returns (strategy_id, params, offset of the PAQ data), or None for an older file."""
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        return None
+    magic, strategy_id, params_length = HEADER.unpack(data[:HEADER.size])
+    params = json.loads(data[HEADER.size:HEADER.size + params_length].decode("utf-8"))
+    return strategy_id, params, HEADER.size + params_length
+
+# Framed files: FRAMED_MAGIC, chunk size, strategy id and parameters as JSON,
+# then per chunk the length of its PAQ data and the data, closed by a zero length.
+# With PER_FRAME_STRATEGY in the header every frame carries its own strategy id
+# and parameters between its length and its data.
+FRAMED_MAGIC = b"BH9F"
+FRAMED_HEADER = struct.Struct(">4sIBI")
+FRAME_LENGTH = struct.Struct(">I")
+FRAME_STRATEGY = struct.Struct(">BI")
+PER_FRAME_STRATEGY = 255
+FILE_CHUNK_SIZE = 16 << 20
+
+def write_framed_header(outfile, chunk_size, strategy_id, params):
+    params_json = json.dumps(params, separators=(",", ":")).encode("utf-8")
+    outfile.write(FRAMED_HEADER.pack(FRAMED_MAGIC, chunk_size, strategy_id, len(params_json)))
+    outfile.write(params_json)
+
+def read_exact(infile, size):
+    data = infile.read(size)
+    if len(data) != size:
+        raise ValueError("The compressed file is cut short.")
+    return data
+
+def write_frame(outfile, compressed_data, strategy_id=None, params=None):
+    """Writes one frame; the strategy only goes in when every frame has its own."""
+    outfile.write(FRAME_LENGTH.pack(len(compressed_data)))
+    written = FRAME_LENGTH.size + len(compressed_data)
+    if strategy_id is not None:
+        params_json = json.dumps(params, separators=(",", ":")).encode("utf-8")
+        outfile.write(FRAME_STRATEGY.pack(strategy_id, len(params_json)))
+        outfile.write(params_json)
+        written += FRAME_STRATEGY.size + len(params_json)
+    outfile.write(compressed_data)
+    return written
+
+def read_frames(infile, strategy_id, params):
+    """(strategy_id, params, PAQ data) of every frame, one at a time."""
+    while True:
+        length, = FRAME_LENGTH.unpack(read_exact(infile, FRAME_LENGTH.size))
+        if length == 0:
+            return
+        if strategy_id == PER_FRAME_STRATEGY:
+            frame_strategy, params_length = FRAME_STRATEGY.unpack(read_exact(infile, FRAME_STRATEGY.size))
+            frame_params = json.loads(read_exact(infile, params_length).decode("utf-8"))
+            yield frame_strategy, frame_params, read_exact(infile, length)
         else:
-            compressed_data.append(data[i])
-        i += 1
-    return bytes(compressed_data)
+            yield strategy_id, params, read_exact(infile, length)
 
-# 10. Find the best compression strategy by applying various strategies
-def find_best_strategy(data):
-    """Find the best compression strategy by applying all strategies."""
-    strategies = [reverse_chunks, apply_random_bytes, compress_strategy_3, function_move, apply_run_length_encoding, strategy_7, strategy_8]
-    best_compressed_data = None
-    best_compression_ratio = float('inf')
-    for strategy in strategies:
-        # We randomly choose chunk size and positions for testing
-        chunk_size = random.randint(1, 256)
-        positions = sorted(random.sample(range(len(data) // chunk_size), random.randint(0, len(data) // chunk_size)))
-        transformed_data = strategy(data, chunk_size, positions)
-        compressed_data = paq.compress(transformed_data)  # Using PAQ compression
-        compression_ratio = len(compressed_data) / len(data)
-        if compression_ratio < best_compression_ratio:
-            best_compression_ratio = compression_ratio
-            best_compressed_data = compressed_data
-    return best_compressed_data, best_compression_ratio
-
-# 11. Process large files for compression and decompression
-def process_large_file(input_filename, output_filename, mode, attempts=1, iterations=100):
+# 13. Process large files for compression and decompression
+def process_large_file(input_filename, output_filename, mode, attempts=1, iterations=100, budget=SEARCH_BUDGET, chunk_size=FILE_CHUNK_SIZE, adaptive=True, cache=None):
     """Handles large files in chunks and applies compression or decompression."""
     if not os.path.exists(input_filename):
         raise FileNotFoundError(f"Error: Input file '{input_filename}' not found.")
-    
-    with open(input_filename, 'rb') as infile:
-        file_data = infile.read()
 
     if mode == "compress":
-        compressed_data, last_byte = compress_data(file_data)
-        with open(output_filename, 'wb') as outfile:
-            outfile.write(compressed_data)
-            outfile.write(bytes([last_byte]))  # Store the last byte for decompression
+        with open(input_filename, 'rb') as infile, open(output_filename, 'wb') as outfile:
+            chunk = infile.read(chunk_size)
+            read_total = written_total = 0
+            if adaptive:
+                # Every chunk picks its own strategy, on a pool of its own so that
+                # trials over one chunk's budget can not hold up the next chunk
+                write_framed_header(outfile, chunk_size, PER_FRAME_STRATEGY, {})
+                picked = {}
+                while chunk:
+                    strategy_id, params, compressed_data, compression_ratio = find_best_strategy(chunk, attempts, iterations, budget, strategy_ids=CHUNK_STRATEGIES, cache=cache)
+                    written_total += write_frame(outfile, compressed_data, strategy_id, params)
+                    read_total += len(chunk)
+                    picked[STRATEGIES[strategy_id][0]] = picked.get(STRATEGIES[strategy_id][0], 0) + 1
+                    chunk = infile.read(chunk_size)
+                outfile.write(FRAME_LENGTH.pack(0))
+                print(f"Strategies per chunk: {picked} (ratio {written_total / max(1, read_total):.4f})")
+                if cache is not None:
+                    cache.report()
+                print(f"Compression complete. Output saved to: {output_filename}")
+                return picked
+
+            # The strategy is picked on the first chunk and used for all of them
+            if chunk:
+                strategy_id, params, compressed_data, compression_ratio = find_best_strategy(chunk, attempts, iterations, budget, cache=cache)
+            else:
+                strategy_id, params, compressed_data = 0, {}, None
+            write_framed_header(outfile, chunk_size, strategy_id, params)
+            while chunk:
+                if compressed_data is None:
+                    compressed_data = paq.compress(STRATEGIES[strategy_id][1](chunk, params))
+                written_total += write_frame(outfile, compressed_data)
+                read_total += len(chunk)
+                compressed_data = None
+                chunk = infile.read(chunk_size)
+            outfile.write(FRAME_LENGTH.pack(0))
+        print(f"Best strategy: {STRATEGIES[strategy_id][0]} {params} (ratio {written_total / max(1, read_total):.4f})")
+        if cache is not None:
+            cache.report()
         print(f"Compression complete. Output saved to: {output_filename}")
-        return last_byte  # Return the last byte for decompression use
+        return strategy_id, params
     elif mode == "decompress":
-        with open(input_filename, 'rb') as infile:
-            compressed_data = infile.read()
-        
-        # The last byte is stored as the last byte in the file
-        last_byte = compressed_data[-1]
-        compressed_data = compressed_data[:-1]  # Remove the last byte
-
         try:
-            restored_data = decompress_data(compressed_data, last_byte)
+            with open(input_filename, 'rb') as infile:
+                magic = infile.read(len(FRAMED_MAGIC))
+                if magic == FRAMED_MAGIC:
+                    magic, chunk_size, strategy_id, params_length = FRAMED_HEADER.unpack(magic + read_exact(infile, FRAMED_HEADER.size - len(magic)))
+                    params = json.loads(read_exact(infile, params_length).decode("utf-8"))
+                    with open(output_filename, 'wb') as outfile:
+                        for frame_strategy, frame_params, compressed_data in read_frames(infile, strategy_id, params):
+                            outfile.write(STRATEGIES[frame_strategy][2](paq.decompress(compressed_data), frame_params))
+                    print(f"Decompression complete. Restored file: {output_filename}")
+                    return
+                compressed_data = magic + infile.read()
+
+            header = read_header(compressed_data)
+            if header is None:
+                # Older files: PAQ data, the last byte XOR 0xFF, then the last byte
+                last_byte = compressed_data[-1]
+                restored_data = decompress_data(compressed_data[:-1], last_byte)
+            else:
+                strategy_id, params, offset = header
+                restored_data = STRATEGIES[strategy_id][2](paq.decompress(compressed_data[offset:]), params)
             with open(output_filename, 'wb') as outfile:
                 outfile.write(restored_data)
             print(f"Decompression complete. Restored file: {output_filename}")
         except Exception as e:
             print(f"Error during decompression: {e}")
 
+# Micro-benchmark of a transform against the form it replaced
+def benchmark_transform(name, new, old, data, *args):
+    started = time.time()
+    new_output = new(data, *args)
+    new_time = time.time() - started
+    started = time.time()
+    old_output = old(data, *args)
+    old_time = time.time() - started
+    same = new_output == old_output
+    print(f"{name:>28} {len(data):>10} bytes: {new_time:8.4f} s, was {old_time:8.4f} s ({old_time / max(new_time, 1e-9):7.1f}x), same output: {same}")
+    return same
+
+# Throughput of a transform and its inverse, and whether they round-trip
+def benchmark_roundtrip(name, forward, inverse, data):
+    started = time.time()
+    encoded = forward(data)
+    forward_time = time.time() - started
+    started = time.time()
+    restored = inverse(encoded)
+    inverse_time = time.time() - started
+    same = restored == data
+    print(f"{name:>28} {len(data):>10} bytes: {len(data) / max(forward_time, 1e-9) / 1e6:8.1f} MB/s, inverse {len(data) / max(inverse_time, 1e-9) / 1e6:8.1f} MB/s, {len(encoded)} bytes encoded, round trip: {same}")
+    return same
+
+def benchmark_transforms(size=1 << 20):
+    data = bytes(random.getrandbits(8) for _ in range(size))
+    same = True
+    for direction, num_bits in [('left', 3), ('right', 13), ('left', size * 8 + 5), ('right', -2)]:
+        same &= benchmark_transform(f"function_move {direction} {num_bits}", function_move, function_move_bits, data, direction, num_bits)
+    same &= benchmark_transform("strategy_7", strategy_7, strategy_7_bits, data, data[-1])
+    # Runs of single bytes and of 4-byte patterns between random stretches
+    pieces = []
+    while sum(map(len, pieces)) < 16 * size:
+        kind = random.randrange(3)
+        if kind == 0:
+            pieces.append(bytes([random.getrandbits(8)]) * random.randint(1, 2000))
+        elif kind == 1:
+            pieces.append(data[:4] * random.randint(1, 500))
+        else:
+            start = random.randrange(size)
+            pieces.append(data[start:start + random.randint(1, 64)])
+    runs = b"".join(pieces)
+    same &= benchmark_roundtrip("apply_run_length_encoding", apply_run_length_encoding, undo_run_length_encoding, runs)
+    same &= benchmark_roundtrip("strategy_8", strategy_8, undo_strategy_8, runs)
+    return same
+
+# Text, runs, random bytes and 4-byte patterns, one kind per stretch of chunk_size
+def mixed_corpus(chunk_size, chunks=8):
+    rng = random.Random(90)
+    words = [b"black", b"hole", b"strategy", b"chunk", b"frame", b"the", b"of", b"compress"]
+    pieces = []
+    for index in range(chunks):
+        kind = index % 4
+        if kind == 0:
+            text = b" ".join(rng.choice(words) for _ in range(chunk_size // 4))
+            pieces.append(text[:chunk_size])
+        elif kind == 1:
+            runs = b"".join(bytes([rng.getrandbits(8)]) * rng.randint(100, 5000) for _ in range(chunk_size // 1000))
+            pieces.append(runs[:chunk_size].ljust(chunk_size, b"\0"))
+        elif kind == 2:
+            pieces.append(rng.getrandbits(8 * chunk_size).to_bytes(chunk_size, "big"))
+        else:
+            pattern = rng.getrandbits(32).to_bytes(4, "big")
+            pieces.append((pattern * (chunk_size // 4 + 1))[:chunk_size])
+    return b"".join(pieces)
+
+# One strategy for the whole file against one per chunk, on a mixed corpus
+def benchmark_adaptive(attempts=1, iterations=100, chunk_size=1 << 20, budget=SEARCH_BUDGET):
+    data = mixed_corpus(chunk_size)
+    with tempfile.TemporaryDirectory() as directory:
+        input_filename = os.path.join(directory, "mixed")
+        with open(input_filename, 'wb') as outfile:
+            outfile.write(data)
+        same = True
+        for adaptive in (False, True):
+            label = "per chunk" if adaptive else "whole file"
+            compressed_filename = os.path.join(directory, label + ".bh")
+            restored_filename = os.path.join(directory, label + ".out")
+            started = time.time()
+            process_large_file(input_filename, compressed_filename, "compress", attempts, iterations, budget, chunk_size, adaptive)
+            elapsed = time.time() - started
+            process_large_file(compressed_filename, restored_filename, "decompress")
+            with open(restored_filename, 'rb') as infile:
+                same &= infile.read() == data
+            compressed_size = os.path.getsize(compressed_filename)
+            print(f"{label:>10}: {len(data)} -> {compressed_size} bytes (ratio {compressed_size / len(data):.4f}), {len(data) / max(elapsed, 1e-9) / 1e6:.2f} MB/s, round trip: {same}")
+    return same
+
 # Main program to execute based on user input
 def main():
-    mode = input("Enter mode (1 for compress, 2 for decompress): ").strip()
+    mode = input("Enter mode (1 for compress, 2 for decompress, 3 for estimator calibration, 4 for transform benchmark, 5 for per-chunk benchmark): ").strip()
+    if mode == '4':  # Transform micro-benchmarks on random data
+        benchmark_transforms()
+        return
+    if mode == '5':  # Whole-file against per-chunk strategy selection on a mixed corpus
+        benchmark_adaptive()
+        return
     input_filename = input("Enter input file name: ").strip()
+
+    if mode == '3':  # Calibration benchmark, nothing is written
+        attempts = int(input("Enter the number of attempts (e.g., 5): ").strip())
+        try:
+            with open(input_filename, 'rb') as infile:
+                calibrate_estimator(infile.read(), attempts)
+        except Exception as e:
+            print(f"Error: {e}")
+        return
+
     output_filename = input("Enter output file name: ").strip()
 
     if mode == '1':  # Compression mode
         attempts = int(input("Enter the number of attempts (e.g., 5): ").strip())
         iterations = int(input("Enter the number of iterations (e.g., 100): ").strip())
+        cache = TrialCache()
         try:
-            process_large_file(input_filename, output_filename, "compress", attempts, iterations)
+            process_large_file(input_filename, output_filename, "compress", attempts, iterations, cache=cache)
         except Exception as e:
             print(f"Error: {e}")
+        finally:
+            cache.close()
     elif mode == '2':  # Decompression mode
         try:
             process_large_file(input_filename, output_filename, "decompress")
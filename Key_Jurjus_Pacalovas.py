@@ -1,31 +1,133 @@
 import os
 import hashlib
+import struct
+import tempfile
+import time
 import getpass  # For invisible password input
 import paq  # Assuming PAQ library is installed (make sure paq is available)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 print("Created by Jurijus Pacalovas.")
 
-def xor_encrypt_decrypt(data, key):
-    """Encrypts or decrypts data using XOR with a repeating key."""
+XOR_CHUNK_SIZE = 1 << 20  # Bytes read, XORed and written at a time
+
+# Framed files: header (magic, version, flags, chunk size, salt, key check),
+# then per chunk the length of its PAQ data and the data, a zero length, and
+# the SHA-256 of the original file XORed with the key stream where the data ends
+MAGIC = b"KJPF"
+VERSION = 1
+COMPRESS_FIRST = 0x01  # Flag: each chunk is compressed, then its PAQ data XORed
+FRAME_HEADER = struct.Struct(">4sBBI16s8s")
+FRAME_LENGTH = struct.Struct(">I")
+PAQ_CHUNK_SIZE = 16 << 20  # Bytes of the file per PAQ frame
+
+def xor_encrypt_decrypt(data, key, offset=0):
+    """Encrypts or decrypts data using XOR with a repeating key; offset is where data starts in the key stream."""
+    key_bytes = key.encode('utf-8') if isinstance(key, str) else key
+    if not data:
+        return b""
+    phase = offset % len(key_bytes)
+    key_tiled = ((key_bytes[phase:] + key_bytes[:phase]) * (len(data) // len(key_bytes) + 1))[:len(data)]
+    if numpy is not None:
+        return numpy.bitwise_xor(numpy.frombuffer(data, dtype=numpy.uint8), numpy.frombuffer(key_tiled, dtype=numpy.uint8)).tobytes()
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key_tiled, "big")).to_bytes(len(data), "big")
+
+def xor_chunks(chunks, key, offset=0):
+    """XORs consecutive chunks as one stream starting at offset of the key stream."""
     key_bytes = key.encode('utf-8')
-    key_repeated = (key_bytes * ((len(data) + len(key_bytes) - 1) // len(key_bytes)))[:len(data)]
-    return bytes([a ^ b for a, b in zip(data, key_repeated)])
+    for chunk in chunks:
+        yield xor_encrypt_decrypt(chunk, key_bytes, offset)
+        offset += len(chunk)
+
+def read_chunks(f, chunk_size=XOR_CHUNK_SIZE):
+    """The rest of a file, chunk_size bytes at a time."""
+    return iter(lambda: f.read(chunk_size), b"")
+
+def split_chunks(data, chunk_size=XOR_CHUNK_SIZE):
+    """Views of data, chunk_size bytes at a time."""
+    view = memoryview(data)
+    return (view[i:i + chunk_size] for i in range(0, len(data), chunk_size))
 
 def calculate_checksum(data):
     """Generates an SHA-256 checksum of the data for verification."""
     return hashlib.sha256(data).digest()
 
-def encrypt_and_compress(filename, key):
-    """Encrypts a file with XOR, adds a checksum, and compresses it using PAQ."""
+def key_check(key, salt):
+    """Eight bytes that tell a wrong password before any frame is read."""
+    return hashlib.sha256(salt + key.encode('utf-8')).digest()[:8]
+
+def read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated file")
+    return data
+
+def read_frames(f):
+    """PAQ data of every frame, one at a time."""
+    while True:
+        length, = FRAME_LENGTH.unpack(read_exact(f, FRAME_LENGTH.size))
+        if length == 0:
+            return
+        yield read_exact(f, length)
+
+def encrypt_and_compress(filename, key, chunk_size=PAQ_CHUNK_SIZE, compress_first=False):
+    """
+    Encrypts a file with XOR and compresses it using PAQ, one chunk_size
+    frame at a time, with the checksum in a trailer. compress_first
+    compresses each chunk before the XOR, so PAQ sees the original bytes.
+    chunk_size=None writes the older single-block layout with the
+    checksum in front, always encrypted first.
+    """
     if not os.path.exists(filename):
         print(f"Error: File '{filename}' not found.")
         return
 
+    if chunk_size is not None:
+        try:
+            encrypted_filename = filename + ".enc"
+            key_bytes = key.encode('utf-8')
+            salt = os.urandom(16)
+            hasher = hashlib.sha256()
+            offset = 0
+            with open(filename, 'rb') as infile, open(encrypted_filename, 'wb') as outfile:
+                flags = COMPRESS_FIRST if compress_first else 0
+                outfile.write(FRAME_HEADER.pack(MAGIC, VERSION, flags, chunk_size, salt, key_check(key, salt)))
+                # The key stream runs over whatever gets XORed: file bytes or PAQ data
+                for chunk in read_chunks(infile, chunk_size):
+                    hasher.update(chunk)
+                    if compress_first:
+                        compressed_data = xor_encrypt_decrypt(paq.compress(chunk), key_bytes, offset)
+                        offset += len(compressed_data)
+                    else:
+                        compressed_data = paq.compress(xor_encrypt_decrypt(chunk, key_bytes, offset))
+                        offset += len(chunk)
+                    outfile.write(FRAME_LENGTH.pack(len(compressed_data)))
+                    outfile.write(compressed_data)
+                outfile.write(FRAME_LENGTH.pack(0))
+                outfile.write(xor_encrypt_decrypt(hasher.digest(), key_bytes, offset))
+
+            print(f"File '{filename}' encrypted and compressed as '{encrypted_filename}'.")
+
+        except Exception as e:
+            print(f"Error during encryption/compression: {e}")
+        return
+
     try:
+        # Checksum while reading, then XOR chunk by chunk after the 32 checksum bytes
+        hasher = hashlib.sha256()
+        chunks = []
         with open(filename, 'rb') as f:
-            data = f.read()
+            for chunk in read_chunks(f):
+                hasher.update(chunk)
+                chunks.append(chunk)
 
-        checksum = calculate_checksum(data)  # Calculate checksum before encryption
-        encrypted_data = xor_encrypt_decrypt(checksum + data, key)  # Store checksum in encrypted data
+        checksum = hasher.digest()  # Calculate checksum before encryption
+        encrypted_data = b"".join(xor_chunks([checksum] + chunks, key))  # Store checksum in encrypted data
+        del chunks
         compressed_data = paq.compress(encrypted_data)  # Compress using PAQ
 
         encrypted_filename = filename + ".enc"
@@ -45,7 +147,11 @@ def decompress_and_decrypt(filename, key):
 
     try:
         with open(filename, 'rb') as f:
-            compressed_data = f.read()
+            magic = f.read(len(MAGIC))
+            if magic == MAGIC:
+                decompress_frames(f, filename, key)
+                return
+            compressed_data = magic + f.read()
 
         try:
             decompressed_data = paq.decompress(compressed_data)  # Decompress using PAQ
@@ -53,26 +159,108 @@ def decompress_and_decrypt(filename, key):
             print(f"Decompression failed: {e}")
             return
 
-        decrypted_data = xor_encrypt_decrypt(decompressed_data, key)
+        # First 32 bytes contain SHA-256 checksum, the rest is the actual file data
+        stored_checksum = xor_encrypt_decrypt(decompressed_data[:32], key)
 
-        # Extract checksum and original data
-        stored_checksum = decrypted_data[:32]  # First 32 bytes contain SHA-256 checksum
-        original_data = decrypted_data[32:]  # Remaining bytes are the actual file data
+        # Decrypt chunk by chunk into a temporary file, kept only if the checksum matches
+        original_filename = filename[:-4]  # Remove .enc extension
+        partial_filename = original_filename + ".part"
+        hasher = hashlib.sha256()
+        with open(partial_filename, 'wb') as f:
+            for chunk in xor_chunks(split_chunks(memoryview(decompressed_data)[32:]), key, 32):
+                hasher.update(chunk)
+                f.write(chunk)
 
         # Validate checksum
-        if stored_checksum != calculate_checksum(original_data):
+        if stored_checksum != hasher.digest():
+            os.remove(partial_filename)
             print("Error: Incorrect password or corrupted file!")
             return
 
-        original_filename = filename[:-4]  # Remove .enc extension
-        with open(original_filename, 'wb') as f:
-            f.write(original_data)
+        os.replace(partial_filename, original_filename)
 
         print(f"File '{filename}' decompressed and decrypted as '{original_filename}'.")
 
     except Exception as e:
         print(f"Error during decryption/decompression: {e}")
 
+def decompress_frames(f, filename, key):
+    """Decrypts a framed file after its header magic, frame by frame."""
+    magic, version, flags, chunk_size, salt, check = FRAME_HEADER.unpack(MAGIC + read_exact(f, FRAME_HEADER.size - len(MAGIC)))
+    if version != VERSION:
+        print(f"Error: Unsupported file version {version}.")
+        return
+    if check != key_check(key, salt):
+        print("Error: Incorrect password or corrupted file!")  # Nothing decompressed yet
+        return
+
+    original_filename = filename[:-4]  # Remove .enc extension
+    partial_filename = original_filename + ".part"
+    key_bytes = key.encode('utf-8')
+    hasher = hashlib.sha256()
+    offset = 0
+    try:
+        with open(partial_filename, 'wb') as outfile:
+            for compressed_data in read_frames(f):
+                if flags & COMPRESS_FIRST:
+                    chunk = paq.decompress(xor_encrypt_decrypt(compressed_data, key_bytes, offset))
+                    offset += len(compressed_data)
+                else:
+                    chunk = xor_encrypt_decrypt(paq.decompress(compressed_data), key_bytes, offset)
+                    offset += len(chunk)
+                hasher.update(chunk)
+                outfile.write(chunk)
+        stored_checksum = xor_encrypt_decrypt(read_exact(f, 32), key_bytes, offset)
+    except Exception:
+        os.remove(partial_filename)
+        raise
+
+    if stored_checksum != hasher.digest():
+        os.remove(partial_filename)
+        print("Error: Incorrect password or corrupted file!")
+        return
+
+    os.replace(partial_filename, original_filename)
+    print(f"File '{filename}' decompressed and decrypted as '{original_filename}'.")
+
+def benchmark_corpora(size=4 << 20):
+    """A text and a binary corpus of about size bytes each, built here so the benchmark needs no files."""
+    words = [b"the", b"key", b"file", b"encrypt", b"compress", b"frame", b"password", b"of", b"and", b"data"]
+    state = 1
+    text = bytearray()
+    while len(text) < size:
+        state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+        text += words[state % len(words)] + (b".\n" if state % 11 == 0 else b" ")
+    # Records of counters, small floats and flags, as binary formats tend to be
+    binary = b"".join(struct.pack("<IfHB", i, (i % 1000) / 7.0, i * 31 % 65536, i % 3) for i in range(size // 11))
+    return {"text": bytes(text[:size]), "binary": binary}
+
+def benchmark_orderings(key, filename=None, chunk_size=PAQ_CHUNK_SIZE):
+    """Ratio and throughput of encrypt-then-compress against compress-then-encrypt."""
+    corpora = benchmark_corpora()
+    if filename and os.path.exists(filename):
+        with open(filename, 'rb') as f:
+            corpora[os.path.basename(filename)] = f.read()
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in corpora.items():
+            path = os.path.join(directory, "corpus")
+            for compress_first in (False, True):
+                with open(path, 'wb') as f:
+                    f.write(data)
+                started = time.time()
+                encrypt_and_compress(path, key, chunk_size, compress_first)
+                encrypt_time = time.time() - started
+                os.remove(path)
+                started = time.time()
+                decompress_and_decrypt(path + ".enc", key)
+                decrypt_time = time.time() - started
+                with open(path, 'rb') as f:
+                    same = f.read() == data
+                size = os.path.getsize(path + ".enc")
+                order = "compress, encrypt" if compress_first else "encrypt, compress"
+                print(f"{name:>10} {order}: {len(data)} -> {size} bytes (ratio {size / max(1, len(data)):.4f}), "
+                      f"{len(data) / max(encrypt_time, 1e-9) / 1e6:.2f} MB/s, back {len(data) / max(decrypt_time, 1e-9) / 1e6:.2f} MB/s, round trip: {same}")
+
 def invisible_input(prompt="Enter encryption key: "):
     """Reads password input without displaying anything (fully invisible)."""
     return getpass.getpass(prompt)  # Works on Linux, macOS, Windows
@@ -93,13 +281,16 @@ if __name__ == "__main__":
         print("Error: Filename cannot be empty.")
         exit()
 
-    action = input("Encrypt (e) or decrypt (d)? ").strip().lower()
+    action = input("Encrypt (e), decrypt (d) or benchmark the orderings (b)? ").strip().lower()
 
     if action == 'e':
-        encrypt_and_compress(filename, key)
+        order = input("Compress then encrypt (c) or encrypt then compress (x)? [c] ").strip().lower()
+        encrypt_and_compress(filename, key, compress_first=order != 'x')
     elif action == 'd':
         if not filename.endswith(".enc"):
             filename += ".enc"  # Ensure correct file extension
         decompress_and_decrypt(filename, key)
+    elif action == 'b':
+        benchmark_orderings(key, filename)
     else:
-        print("Invalid choice. Please enter 'e' for encryption or 'd' for decryption.")
\ No newline at end of file
+        print("Invalid choice. Please enter 'e' for encryption, 'd' for decryption or 'b' for the benchmark.")
\ No newline at end of file